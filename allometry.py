@@ -0,0 +1,202 @@
+"""Log-log allometric fits for every level of a grouping column at once.
+
+Ordinary least squares and reduced major axis slopes both come from six sums
+per group (n, sum x, sum y, sum x^2, sum y^2, sum xy), which np.bincount
+collects for every group in one pass. Bootstrap confidence intervals resample
+within each group; the resamples are split into chunks that can be spread over
+worker processes.
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Tuple
+
+fit_types = {"Ordinary least squares": "ols", "Reduced major axis": "rma"}
+
+
+def _slopes(
+    n: np.ndarray,
+    sx: np.ndarray,
+    sy: np.ndarray,
+    sxx: np.ndarray,
+    syy: np.ndarray,
+    sxy: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Closed form OLS and RMA fits from per-group sums, works on any array shape"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x, mean_y = sx / n, sy / n
+        cxx = sxx - sx * mean_x
+        cyy = syy - sy * mean_y
+        cxy = sxy - sx * mean_y
+        ols = cxy / cxx
+        rma = np.sign(cxy) * np.sqrt(cyy / cxx)
+        r_squared = cxy * cxy / (cxx * cyy)
+    return {
+        "ols_slope": ols,
+        "ols_intercept": mean_y - ols * mean_x,
+        "rma_slope": rma,
+        "rma_intercept": mean_y - rma * mean_x,
+        "r_squared": r_squared,
+    }
+
+
+def grouped_sums(
+    x: np.ndarray, y: np.ndarray, codes: np.ndarray, n_groups: int
+) -> Tuple[np.ndarray, ...]:
+    """Returns n, sum x, sum y, sum x^2, sum y^2 and sum xy for each group code"""
+    return (
+        np.bincount(codes, minlength=n_groups).astype(np.float64),
+        np.bincount(codes, weights=x, minlength=n_groups),
+        np.bincount(codes, weights=y, minlength=n_groups),
+        np.bincount(codes, weights=x * x, minlength=n_groups),
+        np.bincount(codes, weights=y * y, minlength=n_groups),
+        np.bincount(codes, weights=x * y, minlength=n_groups),
+    )
+
+
+def bootstrap_chunk(
+    x: np.ndarray,
+    y: np.ndarray,
+    codes: np.ndarray,
+    n_groups: int,
+    n_boot: int,
+    seed: np.random.SeedSequence,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fits n_boot resamples of every group
+
+    Rows are resampled with replacement within their own group, so every
+    resample keeps the group sizes of the data.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        OLS and RMA slopes, each (n_groups, n_boot)
+    """
+    rng = np.random.default_rng(seed)
+    ols = np.full((n_groups, n_boot), np.nan)
+    rma = np.full((n_groups, n_boot), np.nan)
+    for group in range(n_groups):
+        rows = np.flatnonzero(codes == group)
+        if len(rows) < 3:
+            continue
+        picks = rows[rng.integers(0, len(rows), size=(n_boot, len(rows)))]
+        bx, by = x[picks], y[picks]
+        fits = _slopes(
+            np.full(n_boot, float(len(rows))),
+            bx.sum(axis=1),
+            by.sum(axis=1),
+            (bx * bx).sum(axis=1),
+            (by * by).sum(axis=1),
+            (bx * by).sum(axis=1),
+        )
+        ols[group], rma[group] = fits["ols_slope"], fits["rma_slope"]
+    return ols, rma
+
+
+def pooled_label(labels: List[str]) -> str:
+    """Returns a label for the fit of all rows together that no group has"""
+    label, number = "All", 1
+    while label in set(labels):
+        label = "All (pooled)" if number == 1 else f"All (pooled {number})"
+        number += 1
+    return label
+
+
+def fit_groups(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    group: Optional[str] = None,
+    n_boot: int = 0,
+    confidence: float = 0.95,
+    seed: int = 0,
+    chunk_size: int = 250,
+    map_function: Callable = map,
+) -> pd.DataFrame:
+    """Fits y on x for every level of a grouping column, plus all rows together
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The data, x and y are usually already logged
+    x : str
+        Predictor column, like logBodyMass
+    y : str
+        Response column, like logECV
+    group : Optional[str]
+        Column to split by, like Taxon
+    n_boot : int
+        Bootstrap resamples per group, 0 skips the confidence intervals
+    confidence : float
+        Width of the percentile confidence intervals
+    seed : int
+        Seed for the resampling, so the intervals don't change between reruns
+    chunk_size : int
+        Resamples per chunk handed to map_function
+    map_function : Callable
+        map or a parallel equivalent, like RenderPool.map
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group with n, OLS and RMA slopes and intercepts, r squared and,
+        when bootstrapped, the slope confidence intervals. The last row is the fit of
+        all rows together, labelled All unless a group already has that name, see
+        pooled_label
+
+    Raises
+    ------
+    ValueError
+        If x and y are the same column or the grouping column is one of them
+    """
+    if x == y:
+        raise ValueError(f"Pick different columns for x and y, both are {x}")
+    if group in (x, y):
+        raise ValueError(f"{group} can't be fitted and split by at the same time")
+    data = df[[x, y] + ([group] if group else [])].dropna()
+    x_vals = data[x].to_numpy(dtype=np.float64)
+    y_vals = data[y].to_numpy(dtype=np.float64)
+    if group:
+        codes, labels = pd.factorize(data[group].astype(str), sort=True)
+        labels = list(labels)
+        labels.append(pooled_label(labels))
+        # Every row is counted a second time under the last code for the pooled fit
+        codes = np.concatenate([codes, np.full(len(codes), len(labels) - 1)])
+        x_vals = np.concatenate([x_vals, x_vals])
+        y_vals = np.concatenate([y_vals, y_vals])
+    else:
+        labels = ["All"]
+        codes = np.zeros(len(data), dtype=np.int64)
+    n_groups = len(labels)
+
+    fits = _slopes(*grouped_sums(x_vals, y_vals, codes, n_groups))
+    table = pd.DataFrame(fits, index=pd.Index(labels, name=group or "Group"))
+    table.insert(0, "n", np.bincount(codes, minlength=n_groups))
+
+    if n_boot > 0:
+        chunks = [chunk_size] * (n_boot // chunk_size)
+        if n_boot % chunk_size:
+            chunks.append(n_boot % chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        results = list(
+            map_function(
+                bootstrap_chunk,
+                [x_vals] * len(chunks),
+                [y_vals] * len(chunks),
+                [codes] * len(chunks),
+                [n_groups] * len(chunks),
+                chunks,
+                seeds,
+            )
+        )
+        tail = (1 - confidence) / 2 * 100
+        for name, position in [("ols", 0), ("rma", 1)]:
+            slopes = np.concatenate([result[position] for result in results], axis=1)
+            with warnings.catch_warnings():
+                # Groups with fewer than three rows have no resamples
+                warnings.simplefilter("ignore", RuntimeWarning)
+                low, high = np.nanpercentile(slopes, [tail, 100 - tail], axis=1)
+            table[f"{name}_slope_low"] = low
+            table[f"{name}_slope_high"] = high
+    return table
@@ -0,0 +1,204 @@
+"""Local copies of the images shown in the sidebar and the browser tab.
+
+The logos are hosted on other sites, so every client used to fetch them from
+there on every rerun and the page waited on whichever host was slowest. Each
+image is now downloaded once in a background thread (or read from visuals/ when
+it is in the repository), resized to the width it is shown at and kept in
+memory as PNG bytes. Until a download has finished the image is simply left
+out, and a failed download is tried again after a growing delay.
+"""
+
+import io
+import time
+import hashlib
+import pathlib
+import tempfile
+import threading
+import requests
+from PIL import Image
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+default_cache_dir = pathlib.Path(tempfile.gettempdir()).joinpath("csats_assets")
+
+
+@dataclass(frozen=True)
+class Asset:
+    """A resized image ready to hand to st.image"""
+
+    data: bytes
+    width: int
+    height: int
+
+    def image(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.data))
+
+
+class AssetCache:
+    """Downloads remote images in the background and serves resized copies
+
+    Parameters
+    ----------
+    cache_dir : pathlib.Path
+        Where downloaded originals are kept between restarts
+    timeout : float
+        Seconds to wait for a remote host before an attempt fails
+    retry_after : float
+        Seconds before a failed download is tried again, doubled after every
+        further failure
+    max_retry_after : float
+        Longest wait between two attempts
+    """
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path = default_cache_dir,
+        timeout: float = 10.0,
+        retry_after: float = 30.0,
+        max_retry_after: float = 900.0,
+    ):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._assets: Dict[Tuple[str, Optional[int]], Asset] = {}
+        self._downloading: Set[str] = set()
+        # url -> (failed attempts, time.monotonic() of the next attempt)
+        self._failures: Dict[str, Tuple[int, float]] = {}
+
+    def _target(self, url: str) -> pathlib.Path:
+        suffix = pathlib.Path(url.split("?")[0]).suffix or ".img"
+        return self.cache_dir.joinpath(hashlib.sha1(url.encode()).hexdigest() + suffix)
+
+    def prefetch(self, url: str, local_path: Optional[pathlib.Path] = None):
+        """Starts downloading an image in a background thread
+
+        Nothing happens if the image is already on disk, is being downloaded or
+        failed too recently to be tried again.
+
+        Parameters
+        ----------
+        url : str
+            Where the image is hosted
+        local_path : Optional[pathlib.Path]
+            Copy of the image in the repository, used instead of the url if it exists
+        """
+        if local_path is not None and pathlib.Path(local_path).exists():
+            return
+        if self._target(url).exists():
+            return
+        with self._lock:
+            if url in self._downloading:
+                return
+            _, retry_at = self._failures.get(url, (0, 0.0))
+            if time.monotonic() < retry_at:
+                return
+            self._downloading.add(url)
+        threading.Thread(target=self._download, args=(url,), daemon=True).start()
+
+    def _download(self, url: str):
+        target = self._target(url)
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            partial = target.with_suffix(target.suffix + ".part")
+            partial.write_bytes(response.content)
+            partial.replace(target)
+        except (requests.exceptions.RequestException, OSError):
+            self._failed(url)
+        else:
+            with self._lock:
+                self._failures.pop(url, None)
+        finally:
+            with self._lock:
+                self._downloading.discard(url)
+
+    def _failed(self, url: str):
+        """Schedules the next attempt at a url that couldn't be downloaded or read"""
+        with self._lock:
+            attempts = self._failures.get(url, (0, 0.0))[0] + 1
+            delay = min(self.retry_after * 2 ** (attempts - 1), self.max_retry_after)
+            self._failures[url] = (attempts, time.monotonic() + delay)
+
+    def fetch(
+        self, url: str, local_path: Optional[pathlib.Path] = None
+    ) -> Optional[pathlib.Path]:
+        """Returns a path to the original image, starting a download if needed
+
+        Parameters
+        ----------
+        url : str
+            Where the image is hosted
+        local_path : Optional[pathlib.Path]
+            Copy of the image in the repository, used instead of the url if it exists
+
+        Returns
+        -------
+        Optional[pathlib.Path]
+            The file on disk, or None until it has been downloaded
+        """
+        if local_path is not None and pathlib.Path(local_path).exists():
+            return pathlib.Path(local_path)
+        target = self._target(url)
+        if target.exists():
+            return target
+        self.prefetch(url, local_path)
+        return None
+
+    def get(
+        self,
+        url: str,
+        width: Optional[int] = None,
+        local_path: Optional[pathlib.Path] = None,
+    ) -> Optional[Asset]:
+        """Returns the image resized to a width, from memory after the first call
+
+        Never waits on the remote host.
+
+        Parameters
+        ----------
+        url : str
+            Where the image is hosted, also used as the cache key
+        width : Optional[int]
+            Width in pixels the image is shown at, None keeps the original size
+        local_path : Optional[pathlib.Path]
+            Copy of the image in the repository
+
+        Returns
+        -------
+        Optional[Asset]
+            The image, or None while it is being downloaded or after the download
+            failed
+        """
+        key = (url, width)
+        with self._lock:
+            if key in self._assets:
+                return self._assets[key]
+
+        path = self.fetch(url, local_path)
+        if path is None:
+            return None
+        try:
+            asset = self._resize(path, width)
+        except OSError:
+            # Not an image PIL can read, download it again later
+            if path == self._target(url):
+                path.unlink(missing_ok=True)
+                self._failed(url)
+            return None
+        with self._lock:
+            self._assets[key] = asset
+        return asset
+
+    @staticmethod
+    def _resize(path: pathlib.Path, width: Optional[int]) -> Asset:
+        with Image.open(path) as image:
+            image = image.convert("RGBA")
+            if width is not None and image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+        return Asset(data=buffer.getvalue(), width=image.width, height=image.height)
@@ -0,0 +1,241 @@
+"""Pairwise Pearson correlations that update one column at a time.
+
+All correlations come from four matrix products over the numeric columns: the
+pairwise counts of rows where both values exist, the sums, the sums of squares
+and the cross products. When a column is added or changes, only its row and
+column of those products are recomputed, so adding a derived column to a wide
+dataset costs one pass over the data instead of a full recompute.
+"""
+
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Hashable, List, Optional
+
+
+def _column_hash(values: pd.Series) -> str:
+    digest = hashlib.sha1(str(values.dtype).encode())
+    digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class CorrelationMatrix:
+    """Running pairwise statistics for the numeric columns of one dataset"""
+
+    def __init__(self):
+        self.columns: List[str] = []
+        self._hashes: Dict[str, str] = {}
+        self._index: Optional[pd.Index] = None
+        self._values = np.empty((0, 0))
+        self._valid = np.empty((0, 0))
+        self._count = np.empty((0, 0))
+        self._sum = np.empty((0, 0))
+        self._square = np.empty((0, 0))
+        self._cross = np.empty((0, 0))
+        self.recomputed: List[str] = []
+
+    def update(self, df: pd.DataFrame) -> List[str]:
+        """Brings the statistics in line with the dataset
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The dataset, only numeric columns are used
+
+        Returns
+        -------
+        List[str]
+            The columns whose row and column had to be recomputed
+        """
+        df = df.rename(columns=str)
+        numeric = [
+            column
+            for column in df.columns
+            if pd.api.types.is_numeric_dtype(df[column])
+            and not pd.api.types.is_bool_dtype(df[column])
+        ]
+        if self._index is None or not df.index.equals(self._index):
+            self.__init__()
+            self._index = df.index.copy()
+            self._reset(len(df))
+
+        hashes = {name: _column_hash(df[name]) for name in numeric}
+        for name in [name for name in self.columns if name not in hashes]:
+            self._drop(name)
+        changed = [name for name in numeric if self._hashes.get(name) != hashes[name]]
+        if len(changed) > len(numeric) // 2:
+            self._rebuild(df[numeric].to_numpy(dtype=np.float64))
+            self.columns = numeric
+        else:
+            for name in changed:
+                self._set(name, df[name].to_numpy(dtype=np.float64))
+        self._hashes = hashes
+        self.recomputed = changed
+        return changed
+
+    def _reset(self, n_rows: int):
+        self._values = np.empty((n_rows, 0))
+        self._valid = np.empty((n_rows, 0))
+
+    def _rebuild(self, block: np.ndarray):
+        """Computes every pairwise product at once"""
+        valid = ~np.isnan(block)
+        self._values = np.where(valid, block, 0.0)
+        self._valid = valid.astype(np.float64)
+        self._count = self._valid.T @ self._valid
+        self._sum = self._values.T @ self._valid
+        self._square = (self._values**2).T @ self._valid
+        self._cross = self._values.T @ self._values
+
+    def _drop(self, name: str):
+        position = self.columns.index(name)
+        self.columns.pop(position)
+        self._values = np.delete(self._values, position, axis=1)
+        self._valid = np.delete(self._valid, position, axis=1)
+        for attr in ("_count", "_sum", "_square", "_cross"):
+            matrix = getattr(self, attr)
+            matrix = np.delete(np.delete(matrix, position, axis=0), position, axis=1)
+            setattr(self, attr, matrix)
+
+    def _set(self, name: str, column: np.ndarray):
+        valid = ~np.isnan(column)
+        values = np.where(valid, column, 0.0)
+        if name in self.columns:
+            position = self.columns.index(name)
+        else:
+            position = len(self.columns)
+            self.columns.append(name)
+            self._values = np.column_stack([self._values, values])
+            self._valid = np.column_stack([self._valid, valid.astype(np.float64)])
+            for attr in ("_count", "_sum", "_square", "_cross"):
+                matrix = np.pad(getattr(self, attr), ((0, 1), (0, 1)))
+                setattr(self, attr, matrix)
+        self._values[:, position] = values
+        self._valid[:, position] = valid
+
+        # Row and column of each product for the new column against every column.
+        # _sum[i, j] is the sum of column i over rows where column j also exists.
+        valid = valid.astype(np.float64)
+        count = self._valid.T @ valid
+        self._count[position, :] = count
+        self._count[:, position] = count
+        self._sum[:, position] = self._values.T @ valid
+        self._sum[position, :] = values @ self._valid
+        self._square[:, position] = (self._values**2).T @ valid
+        self._square[position, :] = (values**2) @ self._valid
+        cross = self._values.T @ values
+        self._cross[position, :] = cross
+        self._cross[:, position] = cross
+
+    def matrix(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Returns the correlation matrix, using pairwise complete rows like df.corr
+
+        Parameters
+        ----------
+        columns : Optional[List[str]]
+            Columns to include, all numeric columns by default
+
+        Returns
+        -------
+        pd.DataFrame
+            Pearson correlations, NaN where fewer than two rows overlap
+        """
+        columns = columns or self.columns
+        picks = [self.columns.index(name) for name in columns]
+        grid = np.ix_(picks, picks)
+        n = self._count[grid]
+        sum_x, sum_y = self._sum[grid], self._sum[grid].T
+        square_x, square_y = self._square[grid], self._square[grid].T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = n * self._cross[grid] - sum_x * sum_y
+            spread = np.sqrt(
+                (n * square_x - sum_x**2).clip(min=0)
+                * (n * square_y - sum_y**2).clip(min=0)
+            )
+            r = np.clip(covariance / spread, -1.0, 1.0)
+        r[n < 2] = np.nan
+        return pd.DataFrame(r, index=columns, columns=columns)
+
+
+class CorrelationStore:
+    """One CorrelationMatrix per dataset version, shared by every session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrices: Dict[Hashable, CorrelationMatrix] = {}
+
+    def invalidate(self, dataset: str):
+        """Drops the statistics of a dataset whose file changed"""
+        with self._lock:
+            for key in [key for key in self._matrices if key[0] == dataset]:
+                del self._matrices[key]
+
+    def correlations(
+        self,
+        dataset: str,
+        version: Hashable,
+        df: pd.DataFrame,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """Returns the correlation matrix of a dataset, updating any changed columns
+
+        Parameters
+        ----------
+        dataset : str
+            Name of the dataset
+        version : Hashable
+            Changes whenever the dataset's file changes
+        df : pd.DataFrame
+            The dataset, including any derived columns
+        columns : Optional[List[str]]
+            Columns to include, all numeric columns by default
+
+        Returns
+        -------
+        pd.DataFrame
+            Pearson correlations
+        """
+        with self._lock:
+            matrix = self._matrices.setdefault((dataset, version), CorrelationMatrix())
+            matrix.update(df)
+            return matrix.matrix(columns)
+
+
+def downsample(
+    df: pd.DataFrame, max_points: int, by: Optional[str] = None, seed: int = 0
+) -> pd.DataFrame:
+    """Returns at most max_points rows, keeping the share of each group
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataset
+    max_points : int
+        Rows to keep
+    by : Optional[str]
+        Column whose groups should keep their share of the rows
+    seed : int
+        Seed so the same rows are picked on every rerun
+
+    Returns
+    -------
+    pd.DataFrame
+        The sampled rows in their original order
+    """
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    if by is None:
+        picks = rng.choice(len(df), size=max_points, replace=False)
+    else:
+        fraction = max_points / len(df)
+        picks = np.concatenate(
+            [
+                rng.choice(
+                    rows, size=max(1, round(len(rows) * fraction)), replace=False
+                )
+                for rows in df.groupby(by, sort=False).indices.values()
+            ]
+        )
+    return df.iloc[np.sort(picks)]
@@ -0,0 +1,158 @@
+"""In-memory catalogue of the CSV files in Data/.
+
+A background thread takes a snapshot of the modification time and size of every
+file every few seconds, so reruns read the listing from memory instead of
+scanning the folder. When a file is added, changed or removed only that dataset
+is dropped from the catalogue's dataframe cache, and every callback registered
+with subscribe() is told its name so other caches can do the same. With a
+DiskCache, parsed dataframes are also stored on disk under the sha1 of the file,
+so a restarted or new app process skips parsing the CSV.
+"""
+
+import pathlib
+import threading
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Tuple
+from disk_cache import DiskCache, file_digest
+
+# (modification time in ns, size in bytes)
+Version = Tuple[int, int]
+
+
+def default_data_dirs() -> List[pathlib.Path]:
+    """Folders checked for data, the second one is used by the cloned repository"""
+    return [
+        pathlib.Path("Data"),
+        pathlib.Path.cwd().joinpath("CSATS_PSU_2021").joinpath("Data"),
+    ]
+
+
+class DatasetCatalogue:
+    """Tracks the files in the data folder and caches their dataframes
+
+    Parameters
+    ----------
+    data_dirs : Optional[List[pathlib.Path]]
+        Folders to look in, the first one with matching files is used
+    pattern : str
+        Glob pattern of the files to track
+    interval : float
+        Seconds between snapshots of the folder, 0 disables the background thread
+    disk_cache : Optional[DiskCache]
+        Persistent cache for the parsed dataframes
+    """
+
+    def __init__(
+        self,
+        data_dirs: Optional[List[pathlib.Path]] = None,
+        pattern: str = "*.csv",
+        interval: float = 2.0,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        self.data_dirs = [pathlib.Path(d) for d in (data_dirs or default_data_dirs())]
+        self.pattern = pattern
+        self.interval = interval
+        self.disk_cache = disk_cache
+        self._lock = threading.RLock()
+        self._files: Dict[str, pathlib.Path] = {}
+        self._versions: Dict[str, Version] = {}
+        self._frames: Dict[str, Tuple[Version, pd.DataFrame]] = {}
+        self._subscribers: List[Callable[[str], None]] = []
+        self._stop = threading.Event()
+        self.refresh()
+        if interval > 0:
+            self._thread = threading.Thread(
+                target=self._poll, name="dataset-catalogue", daemon=True
+            )
+            self._thread.start()
+
+    def _snapshot(self) -> Dict[str, Tuple[pathlib.Path, Version]]:
+        for folder in self.data_dirs:
+            snapshot = {}
+            for path in sorted(folder.glob(self.pattern)):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    # Removed between the glob and the stat
+                    continue
+                snapshot[path.stem] = (path, (stat.st_mtime_ns, stat.st_size))
+            if snapshot:
+                return snapshot
+        return {}
+
+    def refresh(self) -> List[str]:
+        """Takes a snapshot of the folder now and returns the names that changed"""
+        snapshot = self._snapshot()
+        with self._lock:
+            changed = [
+                name
+                for name in set(self._versions) | set(snapshot)
+                if self._versions.get(name) != snapshot.get(name, (None, None))[1]
+            ]
+            self._files = {name: path for name, (path, _) in snapshot.items()}
+            self._versions = {name: version for name, (_, version) in snapshot.items()}
+            for name in changed:
+                self._frames.pop(name, None)
+            subscribers = list(self._subscribers)
+        for name in changed:
+            for callback in subscribers:
+                callback(name)
+        return changed
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except OSError:
+                # The folder can briefly disappear while the repository is pulled
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+    def subscribe(self, callback: Callable[[str], None]):
+        """Registers a callback that is called with the name of each changed dataset"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def files(self) -> Dict[str, str]:
+        """Returns the dataset names and their file names"""
+        with self._lock:
+            return {name: path.name for name, path in self._files.items()}
+
+    def path(self, name: str) -> pathlib.Path:
+        with self._lock:
+            return self._files[name]
+
+    def version(self, name: str) -> Version:
+        """Returns a token that changes whenever the dataset's file changes"""
+        with self._lock:
+            return self._versions[name]
+
+    def read(self, name: str) -> pd.DataFrame:
+        """Returns the dataset, reading the file only if it changed since the last read
+
+        Parameters
+        ----------
+        name : str
+            Dataset name, the file name without .csv
+
+        Returns
+        -------
+        pd.DataFrame
+            The dataset, shared between sessions so it shouldn't be changed in place
+        """
+        with self._lock:
+            path, version = self._files[name], self._versions[name]
+            cached = self._frames.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if self.disk_cache is None:
+            df = pd.read_csv(path)
+        else:
+            key = self.disk_cache.key("dataset", file_digest(path))
+            df = self.disk_cache.get_or_compute(key, lambda: pd.read_csv(path))
+        with self._lock:
+            if self._versions.get(name) == version:
+                self._frames[name] = (version, df)
+        return df
@@ -0,0 +1,264 @@
+"""New columns computed from expressions typed into the app.
+
+An expression such as ``FemurLength / HumerusLength`` or ``log10(`Body mass`)``
+is parsed with ``ast`` and only arithmetic, numbers, column names and a short
+list of maths functions are let through before it is handed to
+``DataFrame.eval``, which evaluates it on whole columns (with numexpr when it is
+installed). Results are cached per dataset version and expression, so adding a
+column doesn't re-read the CSV or recompute the columns added before it.
+"""
+
+import re
+import ast
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Hashable, List, Set, Tuple
+
+# Functions DataFrame.eval understands and the number of arguments they take
+allowed_functions = {
+    "abs": 1,
+    "arccos": 1,
+    "arccosh": 1,
+    "arcsin": 1,
+    "arcsinh": 1,
+    "arctan": 1,
+    "arctan2": 2,
+    "cos": 1,
+    "cosh": 1,
+    "exp": 1,
+    "expm1": 1,
+    "log": 1,
+    "log10": 1,
+    "log1p": 1,
+    "sin": 1,
+    "sinh": 1,
+    "sqrt": 1,
+    "tan": 1,
+    "tanh": 1,
+}
+
+_allowed_nodes = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.USub,
+    ast.UAdd,
+)
+
+# Powers of constants are worked out on Python integers, so 9 ** 9 ** 9 would
+# never finish. Exponents without a column are kept to small numbers.
+_max_exponent = 1000
+_exponent_operators = (ast.Add, ast.Sub, ast.Div)
+
+_quoted_name = re.compile(r"`([^`]+)`")
+
+# (column name, expression)
+Definition = Tuple[str, str]
+
+
+def referenced_columns(expression: str, columns: List[str]) -> Set[str]:
+    """Checks an expression and returns the columns it uses
+
+    Column names that aren't valid Python names, like ``Body mass``, are written
+    between backticks.
+
+    Parameters
+    ----------
+    expression : str
+        The expression
+    columns : List[str]
+        Columns of the dataset
+
+    Returns
+    -------
+    Set[str]
+        The columns the expression reads
+
+    Raises
+    ------
+    ValueError
+        If the expression has a syntax error, uses an unknown column, or uses
+        anything other than arithmetic and the allowed functions
+    """
+    quoted = {}
+
+    def placeholder(match):
+        name = f"_quoted_{len(quoted)}"
+        quoted[name] = match.group(1)
+        return name
+
+    try:
+        tree = ast.parse(_quoted_name.sub(placeholder, expression), mode="eval")
+    except SyntaxError as error:
+        raise ValueError(f"Couldn't read the expression: {error.msg}")
+
+    # Only the name being called is a function, any other name must be a column
+    function_names = {
+        id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)
+    }
+    used = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed_nodes):
+            raise ValueError(f"'{type(node).__name__}' isn't allowed in an expression")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise ValueError("Only plain function calls are allowed")
+            if node.func.id not in allowed_functions:
+                raise ValueError(f"Unknown function {node.func.id}")
+            arity = allowed_functions[node.func.id]
+            if len(node.args) != arity:
+                raise ValueError(
+                    f"{node.func.id} takes {arity} "
+                    f"argument{'s' if arity > 1 else ''}, not {len(node.args)}"
+                )
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            _check_exponent(node.right, function_names)
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise ValueError("Only numbers can be used as constants")
+        elif isinstance(node, ast.Name) and id(node) not in function_names:
+            name = quoted.get(node.id, node.id)
+            if name not in columns:
+                raise ValueError(f"There is no column called {name}")
+            used.add(name)
+    return used
+
+
+def _check_exponent(exponent: ast.AST, function_names: Set[int]):
+    """Rejects a constant exponent that could make a huge integer"""
+    nodes = list(ast.walk(exponent))
+    if any(
+        isinstance(node, ast.Name) and id(node) not in function_names for node in nodes
+    ):
+        # Raised to a column, numpy works it out on floats
+        return
+    for node in nodes:
+        too_large = (
+            isinstance(node, ast.Constant)
+            and isinstance(node.value, (int, float))
+            and abs(node.value) > _max_exponent
+        )
+        if too_large or (
+            isinstance(node, ast.BinOp) and not isinstance(node.op, _exponent_operators)
+        ):
+            raise ValueError(
+                f"Exponents without a column can only use numbers up to {_max_exponent} "
+                "with + - and /"
+            )
+
+
+def evaluate(df: pd.DataFrame, expression: str) -> pd.Series:
+    """Evaluates a checked expression on whole columns of the dataset
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataset
+    expression : str
+        The expression
+
+    Returns
+    -------
+    pd.Series
+        The new column as float64
+
+    Raises
+    ------
+    ValueError
+        If the expression isn't allowed, uses a column that isn't numeric or can't
+        be evaluated
+    """
+    columns = [str(column) for column in df.columns]
+    used = referenced_columns(expression, columns)
+    for name in used:
+        if not pd.api.types.is_numeric_dtype(df[name]):
+            raise ValueError(f"{name} isn't a numeric column")
+    try:
+        with np.errstate(all="ignore"):
+            result = df.eval(expression)
+        if not isinstance(result, pd.Series):
+            # An expression without columns, like 2 * 3
+            result = pd.Series(result, index=df.index)
+        return result.astype("float64")
+    except ValueError:
+        raise
+    except Exception as error:
+        # Anything the checks above let through that pandas still can't evaluate
+        raise ValueError(f"Couldn't evaluate {expression}: {error}") from error
+
+
+class DerivedColumnCache:
+    """Cache of derived columns keyed on dataset, dataset version and definitions
+
+    Parameters
+    ----------
+    max_entries : int
+        Number of columns kept, the least recently used are dropped first
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._columns = OrderedDict()
+
+    def invalidate(self, dataset: str):
+        """Drops every column computed from a dataset"""
+        with self._lock:
+            for key in [key for key in self._columns if key[0] == dataset]:
+                del self._columns[key]
+
+    def add_columns(
+        self,
+        df: pd.DataFrame,
+        dataset: str,
+        version: Hashable,
+        definitions: List[Definition],
+    ) -> pd.DataFrame:
+        """Returns the dataset with the derived columns added
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The dataset as read from its file
+        dataset : str
+            Name of the dataset
+        version : Hashable
+            Changes whenever the dataset's file changes
+        definitions : List[Definition]
+            Column names and expressions, later expressions can use earlier columns
+
+        Returns
+        -------
+        pd.DataFrame
+            A new dataframe, df itself is left unchanged
+        """
+        if not definitions:
+            return df
+        derived = {}
+        for position, (name, expression) in enumerate(definitions):
+            key = (dataset, version, tuple(definitions[: position + 1]))
+            with self._lock:
+                column = self._columns.get(key)
+                if column is not None:
+                    self._columns.move_to_end(key)
+            if column is None:
+                column = evaluate(df.assign(**derived), expression)
+                with self._lock:
+                    self._columns[key] = column
+                    while len(self._columns) > self.max_entries:
+                        self._columns.popitem(last=False)
+            derived[name] = column
+        return df.assign(**derived)
@@ -0,0 +1,285 @@
+"""Persistent cache on local disk shared by restarts and by every app process.
+
+Values are compressed and stored in a SQLite file under a key built from what
+they were computed from (file or dataset hashes and the settings) plus the
+cache format and library versions, so a new deploy reads results an earlier one
+wrote as long as nothing they depend on changed. When the file grows past its
+size limit the least recently used entries are removed.
+
+Nothing is pickled: dataframes are stored as numpy arrays loaded with
+``allow_pickle=False`` and everything else as JSON, so a cache folder other
+processes can write to can corrupt entries but can't run code in the app.
+
+The cache is for local disk on one host. SQLite's write-ahead log relies on
+shared memory between the processes using it, which network filesystems don't
+provide, so pointing CSATS_CACHE_DIR at an NFS or SMB share can corrupt it.
+Every app process and restart on the machine shares the folder; run
+``python warm_cache.py`` after deploying to fill it before students arrive.
+"""
+
+import io
+import os
+import zlib
+import json
+import time
+import sqlite3
+import hashlib
+import pathlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import plotly
+from typing import Any, Dict
+
+cache_format = 2
+default_cache_dir = pathlib.Path(
+    os.environ.get(
+        "CSATS_CACHE_DIR", pathlib.Path(tempfile.gettempdir()).joinpath("csats_cache")
+    )
+)
+default_max_bytes = int(os.environ.get("CSATS_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+# Stored dataframes and figure JSON are only reused by the versions that wrote them
+_namespace = f"{cache_format}|pandas {pd.__version__}|plotly {plotly.__version__}"
+
+_missing = object()
+
+# First byte of a stored value, telling how the rest was written
+_json_value = b"J"
+_frame_value = b"F"
+
+
+def _pack(values: pd.Series, name: str, arrays: Dict[str, np.ndarray]) -> Dict:
+    """Adds a column or index level to arrays, returns how to rebuild it
+
+    Numeric, boolean and datetime values are kept as numpy arrays, anything else
+    (text, categories, nullable types) goes into the JSON description.
+    """
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+        arrays[name] = np.asarray(values)
+        return {"array": name}
+    missing = pd.isna(values)
+    return {
+        "values": [
+            None if is_missing else value
+            for value, is_missing in zip(values.astype(object), missing)
+        ],
+        "dtype": str(values.dtype),
+    }
+
+
+def _unpack(packed: Dict, arrays) -> Any:
+    if "array" in packed:
+        return arrays[packed["array"]]
+    return pd.array(packed["values"], dtype=packed["dtype"])
+
+
+def _frame_bytes(frame: pd.DataFrame) -> bytes:
+    """Writes a dataframe as an npz file that loads without unpickling"""
+    arrays = {}
+    columns = [
+        _pack(frame.iloc[:, position], f"column{position}", arrays)
+        for position in range(frame.shape[1])
+    ]
+    if isinstance(frame.index, pd.RangeIndex):
+        index = {"range": [frame.index.start, frame.index.stop, frame.index.step]}
+    else:
+        index = [
+            _pack(
+                frame.index.get_level_values(level).to_series(), f"index{level}", arrays
+            )
+            for level in range(frame.index.nlevels)
+        ]
+    description = {
+        "names": list(frame.columns),
+        "columns": columns,
+        "index": index,
+        "index_names": list(frame.index.names),
+    }
+    buffer = io.BytesIO()
+    np.savez(buffer, description=np.array(json.dumps(description)), **arrays)
+    return buffer.getvalue()
+
+
+def _read_frame(data: bytes) -> pd.DataFrame:
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        description = json.loads(str(arrays["description"]))
+        columns = [_unpack(packed, arrays) for packed in description["columns"]]
+        if "range" in description["index"]:
+            index = pd.RangeIndex(*description["index"]["range"])
+        else:
+            levels = [_unpack(packed, arrays) for packed in description["index"]]
+            index = pd.MultiIndex.from_arrays(levels)
+            if len(levels) == 1:
+                index = index.get_level_values(0)
+    index.names = description["index_names"]
+    frame = pd.DataFrame(dict(enumerate(columns)), index=index)
+    frame.columns = description["names"]
+    return frame
+
+
+def _dumps(value: Any) -> bytes:
+    if isinstance(value, pd.DataFrame):
+        return _frame_value + _frame_bytes(value)
+    return _json_value + json.dumps(value).encode()
+
+
+def _loads(blob: bytes) -> Any:
+    if blob[:1] == _frame_value:
+        return _read_frame(blob[1:])
+    if blob[:1] == _json_value:
+        return json.loads(blob[1:])
+    raise ValueError("Unknown value format")
+
+
+def file_digest(path: pathlib.Path) -> str:
+    """Returns the sha1 of a file's contents"""
+    digest = hashlib.sha1()
+    with pathlib.Path(path).open("rb") as open_file:
+        for block in iter(lambda: open_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Size bounded, least recently used key-value store in a SQLite file
+
+    Parameters
+    ----------
+    cache_dir : pathlib.Path
+        Folder holding cache.sqlite
+    max_bytes : int
+        Total size of the stored values before old entries are evicted
+    touch_interval : float
+        Seconds before a read records the entry as used again, so hits don't
+        each write to the file
+    """
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path = default_cache_dir,
+        max_bytes: int = default_max_bytes,
+        touch_interval: float = 60,
+    ):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir.joinpath("cache.sqlite")
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    value BLOB NOT NULL
+                )""")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, SQLite connections can't be shared"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Lets readers in other processes carry on while one process writes,
+            # only safe when every process is on the same host
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(kind: str, *parts) -> str:
+        """Builds a versioned key from the kind of value and what it depends on"""
+        text = json.dumps([_namespace, kind, parts], sort_keys=True, default=str)
+        return f"{kind}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Returns a stored value, or default if it isn't in the cache"""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, accessed FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        try:
+            value = _loads(zlib.decompress(row[0]))
+        except Exception:
+            # Written by an incompatible version or damaged, treat it as missing
+            self.delete(key)
+            return default
+        # Eviction order only needs to be roughly right, skip the write when the
+        # entry was marked as used recently
+        now = time.time()
+        if now - row[1] > self.touch_interval:
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+                )
+        return value
+
+    def put(self, key: str, value: Any):
+        """Stores a value, evicting the least recently used entries if needed
+
+        Dataframes and JSON serialisable values are stored, anything else is
+        skipped and computed again next time.
+        """
+        try:
+            blob = zlib.compress(_dumps(value), 1)
+        except (TypeError, ValueError):
+            return
+        if len(blob) > self.max_bytes:
+            return
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, key.split(":")[0], len(blob), time.time(), blob),
+            )
+        self.evict()
+
+    def delete(self, key: str):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits its limit"""
+        connection = self._connection()
+        with connection:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed"
+            ).fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            connection.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def get_or_compute(self, key: str, compute) -> Any:
+        """Returns the stored value for key, computing and storing it on a miss"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> pd.DataFrame:
+        """Returns the number of entries and bytes stored for each kind of value"""
+        rows = (
+            self._connection()
+            .execute("SELECT kind, COUNT(*), SUM(size) FROM entries GROUP BY kind")
+            .fetchall()
+        )
+        return pd.DataFrame(rows, columns=["Kind", "Entries", "Bytes"])
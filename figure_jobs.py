@@ -0,0 +1,237 @@
+"""Per-session figure builds that a newer rerun can take over or supersede.
+
+Streamlit runs each session's script on one thread, and a rerun asked for by a
+widget change only stops the running script at its next ``st.*`` call. A script
+waiting for a slow figure would therefore finish the build, try to draw it and
+only then be interrupted, throwing the figure away. FigureJobs keeps the build
+of every session's chart slot running in the render pool instead:
+
+* while waiting, it checks whether the session has a rerun queued and, if so,
+  stops waiting and leaves the build running;
+* the next rerun that asks the slot for the same figure picks up that build, or
+  its finished result, instead of starting again;
+* a rerun that asks for a different figure supersedes the build: it is
+  cancelled if it hasn't started, otherwise its CPU time is counted as wasted.
+
+Slots and counters of sessions that have been idle for a while are dropped.
+"""
+
+import json
+import time
+import threading
+import plotly.io as pio
+import plotly.graph_objects as go
+from concurrent.futures import CancelledError, Future, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from render_pool import RenderPool
+
+
+@dataclass
+class BuildStats:
+    """Counters for the figure builds of one session"""
+
+    requested: int = 0
+    completed: int = 0
+    reused: int = 0
+    interrupted: int = 0
+    cancelled: int = 0
+    superseded: int = 0
+    used_cpu: float = 0.0
+    wasted_cpu: float = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "Requested": self.requested,
+            "Shown": self.completed,
+            "Taken over from an earlier rerun": self.reused,
+            "Left running by a rerun": self.interrupted,
+            "Cancelled before starting": self.cancelled,
+            "Finished after being superseded": self.superseded,
+            "CPU seconds used": round(self.used_cpu, 3),
+            "CPU seconds wasted": round(self.wasted_cpu, 3),
+        }
+
+    def add(self, other: "BuildStats"):
+        for name in vars(self):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+@dataclass
+class _Ticket:
+    """The build currently owning a chart slot"""
+
+    job: str
+    future: Future
+    cpu_counted: bool = False
+
+
+def _no_rerun() -> bool:
+    return False
+
+
+class FigureJobs:
+    """Figure builds on top of a RenderPool that survive and follow reruns
+
+    Parameters
+    ----------
+    pool : RenderPool
+        The pool that builds the figures
+    poll : float
+        Seconds between checks for a queued rerun while a build is running
+    max_idle : float
+        Seconds without a request before a session's slots and counters are dropped,
+        its counters are kept in the totals
+    """
+
+    def __init__(self, pool: RenderPool, poll: float = 0.05, max_idle: float = 1800.0):
+        self.pool = pool
+        self.poll = poll
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._tickets: Dict[Tuple[str, str], _Ticket] = {}
+        self._stats: Dict[str, BuildStats] = {}
+        self._last_request: Dict[str, float] = {}
+        self._retired = BuildStats()
+        self._pruned = time.monotonic()
+
+    def stats(self, session_id: Optional[str] = None) -> BuildStats:
+        """Returns the counters for one session, or the totals for every session"""
+        with self._lock:
+            if session_id is not None:
+                return self._stats.get(session_id, BuildStats())
+            total = BuildStats()
+            total.add(self._retired)
+            for session_stats in self._stats.values():
+                total.add(session_stats)
+            return total
+
+    def _prune(self, now: float):
+        """Drops the slots and counters of idle sessions, called with the lock held"""
+        if now - self._pruned < min(60.0, self.max_idle):
+            return
+        self._pruned = now
+        idle = [
+            session_id
+            for session_id, last in self._last_request.items()
+            if now - last > self.max_idle
+        ]
+        for session_id in idle:
+            del self._last_request[session_id]
+            self._retired.add(self._stats.pop(session_id, BuildStats()))
+        for key in [key for key in self._tickets if key[0] in idle]:
+            ticket = self._tickets.pop(key)
+            ticket.future.cancel()
+
+    def _ticket(
+        self, session_id: str, slot: str, job: str, submit: Callable[[], Future]
+    ) -> Tuple[_Ticket, BuildStats]:
+        """Returns the slot's build of job, starting it if the slot holds another"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._last_request[session_id] = now
+            stats = self._stats.setdefault(session_id, BuildStats())
+            stats.requested += 1
+            previous = self._tickets.get((session_id, slot))
+            if previous is not None and previous.job == job:
+                if not previous.future.cancelled():
+                    stats.reused += 1
+                    return previous, stats
+        ticket = _Ticket(job, submit())
+        with self._lock:
+            self._tickets[(session_id, slot)] = ticket
+        if previous is not None:
+            self._supersede(previous, stats)
+        return ticket, stats
+
+    def _supersede(self, ticket: _Ticket, stats: BuildStats):
+        if ticket.future.cancel():
+            with self._lock:
+                stats.cancelled += 1
+            return
+
+        def count_waste(done: Future):
+            if done.cancelled() or done.exception() is not None:
+                return
+            with self._lock:
+                if ticket.cpu_counted:
+                    # It was shown before being replaced
+                    return
+                ticket.cpu_counted = True
+                stats.superseded += 1
+                stats.wasted_cpu += done.result()[1]
+
+        ticket.future.add_done_callback(count_waste)
+
+    def render(
+        self,
+        session_id: str,
+        data_id: str,
+        renderer: str,
+        px_args: Dict,
+        slot: str = "chart",
+        rerun_requested: Callable[[], bool] = _no_rerun,
+        **kwargs,
+    ) -> Optional[go.Figure]:
+        """Builds a figure for a session's chart slot
+
+        Parameters
+        ----------
+        session_id : str
+            The Streamlit session asking for the figure
+        data_id : str
+            Id of the dataset in the render pool store
+        renderer : str
+            Plotly express function to use, see render_pool.renderers
+        px_args : Dict
+            Arguments for the plotly express function
+        slot : str
+            Name of the chart on the page, requests only supersede the same slot
+        rerun_requested : Callable[[], bool]
+            Returns True once the session has a newer rerun queued
+        **kwargs
+            layout_args, trace_args and as_str for RenderPool.submit
+
+        Returns
+        -------
+        Optional[go.Figure]
+            The figure, or None if a rerun was queued before it was ready
+        """
+        job = json.dumps(
+            [data_id, renderer, px_args, kwargs], sort_keys=True, default=str
+        )
+
+        def submit(local: bool = False) -> Future:
+            return self.pool.submit(data_id, renderer, px_args, local=local, **kwargs)
+
+        ticket, stats = self._ticket(session_id, slot, job, submit)
+        while True:
+            if rerun_requested():
+                with self._lock:
+                    stats.interrupted += 1
+                return None
+            try:
+                fig_json, cpu_seconds = ticket.future.result(timeout=self.poll)
+                break
+            except TimeoutError:
+                continue
+            except CancelledError:
+                return None
+            except BrokenProcessPool:
+                # A worker died, new ones are started for the next job
+                self.pool.restart()
+                ticket.future = submit(local=True)
+
+        if rerun_requested():
+            # The finished figure stays in the slot for the next rerun
+            with self._lock:
+                stats.interrupted += 1
+            return None
+        with self._lock:
+            stats.completed += 1
+            if not ticket.cpu_counted:
+                ticket.cpu_counted = True
+                stats.used_cpu += cpu_seconds
+        return pio.from_json(fig_json)
@@ -0,0 +1,94 @@
+"""Chart payloads that the plotly.js bundled with Streamlit can draw.
+
+The Streamlit releases this app runs on (the ones with st.beta_columns) bundle
+plotly.js 1.x, which only reads trace arrays written as plain JSON lists.
+plotly.py 6 and newer writes numeric arrays as ``{"dtype", "bdata"}`` typed
+arrays instead, so with those versions every figure is turned back into plain
+lists before it is sent. With older plotly.py figures are sent unchanged.
+
+Payload size is handled by the transport instead: .streamlit/config.toml turns
+on server.enableWebsocketCompression, so the JSON is deflated on the websocket
+for every browser that supports it, which all current ones do.
+"""
+
+import json
+import zlib
+import base64
+import numpy as np
+import plotly
+import plotly.tools
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+from typing import Dict, Union
+
+writes_typed_arrays = int(plotly.__version__.split(".")[0]) >= 6
+
+
+def _decode_typed_array(spec: Dict) -> np.ndarray:
+    values = np.frombuffer(base64.b64decode(spec["bdata"]), dtype=spec["dtype"])
+    if "shape" in spec:
+        values = values.reshape([int(n) for n in str(spec["shape"]).split(",")])
+    return values
+
+
+def _plain(value):
+    """Walks a trace, swapping numpy and typed arrays for lists"""
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            return _decode_typed_array(value).tolist()
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def plain_figure(fig: Union[go.Figure, Dict]) -> Dict:
+    """Returns the figure as a JSON serialisable dict with every array as a list
+
+    Parameters
+    ----------
+    fig : Union[go.Figure, Dict]
+        The figure
+
+    Returns
+    -------
+    Dict
+        A figure dict that st.plotly_chart accepts and plotly.js 1.x can draw
+    """
+    if isinstance(fig, go.Figure):
+        fig = fig.to_plotly_json()
+    plain = dict(fig)
+    plain["data"] = [_plain(trace) for trace in fig.get("data", [])]
+    return plain
+
+
+def browser_figure(fig: Union[go.Figure, Dict]) -> Union[go.Figure, Dict]:
+    """Returns the figure in a form the bundled plotly.js can draw
+
+    Only plotly.py 6 and newer writes typed arrays, older versions don't need the
+    walk over every trace that plain_figure does.
+    """
+    return plain_figure(fig) if writes_typed_arrays else fig
+
+
+def _figure_json(fig: Union[go.Figure, Dict]) -> bytes:
+    # st.plotly_chart validates the figure and serializes it again
+    figure = plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True)
+    return json.dumps(figure, cls=PlotlyJSONEncoder).encode()
+
+
+def payload_bytes(fig: Union[go.Figure, Dict]) -> int:
+    """Returns the size of the figure JSON st.plotly_chart sends to the browser"""
+    return len(_figure_json(fig))
+
+
+def compressed_bytes(fig: Union[go.Figure, Dict]) -> int:
+    """Returns about what the figure JSON takes on a compressed websocket
+
+    permessage-deflate is raw deflate; a fresh compressor is used, so this is an
+    upper bound for a connection that keeps its compression context.
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return len(compressor.compress(_figure_json(fig)) + compressor.flush())
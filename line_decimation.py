@@ -0,0 +1,186 @@
+"""Downsampling helpers for long line series.
+
+Plotly sends every point to the browser, so a 10^6 sample series is both slow to
+build and slow to draw. These helpers pick a subset of rows that keeps the visual
+shape of the line at the width it will actually be shown at.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+decimation_methods = {
+    "Largest-Triangle-Three-Buckets": "lttb",
+    "Min-max per pixel": "minmax",
+    "None": None,
+}
+
+
+def _numeric_axis(values: pd.Series) -> np.ndarray:
+    """Returns a float array that can be used to measure distances along the x-axis
+
+    Parameters
+    ----------
+    values : pd.Series
+        The x-axis column
+
+    Returns
+    -------
+    np.ndarray
+        Numeric version of the column, or the row positions for categorical data
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]").view("int64").astype("float64")
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64")
+    return np.arange(len(values), dtype="float64")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Sorted x values
+    y : np.ndarray
+        y values
+    n_out : int
+        Number of points to keep, including the first and last point
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the points to keep
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket edges for the n - 2 interior points, the end points are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, stops = edges[:-1], edges[1:]
+
+    # Mean of every bucket, used as the third point of the triangle
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.maximum(stops - starts, 1)
+    avg_x = (cum_x[stops] - cum_x[starts]) / counts
+    avg_y = (cum_y[stops] - cum_y[starts]) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for bucket, (start, stop) in enumerate(zip(starts, stops)):
+        bucket_x = x[start:stop]
+        bucket_y = y[start:stop]
+        # Twice the triangle area, the constant factor doesn't change the argmax
+        area = np.abs(
+            (x[anchor] - avg_x[bucket]) * (bucket_y - y[anchor])
+            - (x[anchor] - bucket_x) * (avg_y[bucket] - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def min_max(x: np.ndarray, y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Keeps the lowest and highest point in each pixel wide bucket along the x-axis
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Sorted x values
+    y : np.ndarray
+        y values
+    n_buckets : int
+        Number of buckets, usually the chart width in pixels
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the points to keep, in x order
+    """
+    n = len(x)
+    if n <= 2 * n_buckets or n_buckets < 1:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    if span > 0:
+        bucket_id = np.minimum(
+            ((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1
+        )
+    else:
+        bucket_id = np.arange(n) * n_buckets // n
+
+    # x is sorted so the buckets are contiguous runs
+    starts = np.flatnonzero(np.diff(bucket_id, prepend=-1))
+    counts = np.diff(np.append(starts, n))
+    owner = np.repeat(np.arange(len(starts)), counts)
+
+    keep = [np.array([0, n - 1])]
+    for reduce in (np.minimum, np.maximum):
+        extreme = reduce.reduceat(y, starts)
+        hits = np.flatnonzero(y == np.repeat(extreme, counts))
+        # First hit in each bucket, ties would otherwise add extra points
+        _, first = np.unique(owner[hits], return_index=True)
+        keep.append(hits[first])
+
+    return np.unique(np.concatenate(keep))
+
+
+def decimate_line_data(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    n_points: int,
+    method: Optional[str] = "lttb",
+    color: Optional[str] = None,
+) -> pd.DataFrame:
+    """Returns the rows of a line plot dataframe needed to draw it at a given width
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The data, already sorted by x
+    x : str
+        X-axis column
+    y : str
+        Y-axis column
+    n_points : int
+        Target number of points per line, usually the chart width in pixels
+    method : Optional[str]
+        'lttb', 'minmax' or None to keep every row
+    color : Optional[str]
+        Column the lines are coloured by, each line is downsampled on its own
+
+    Returns
+    -------
+    pd.DataFrame
+        Subset of the rows of df, in their original order
+    """
+    if method is None or not pd.api.types.is_numeric_dtype(df[y]):
+        return df
+
+    if color is None:
+        groups = [np.arange(len(df))]
+    else:
+        groups = list(df.groupby(color, sort=False).indices.values())
+    x_all = _numeric_axis(df[x])
+    y_all = df[y].to_numpy(dtype="float64")
+    keep = []
+    for rows in groups:
+        rows = rows[~np.isnan(y_all[rows]) & ~np.isnan(x_all[rows])]
+        if method == "lttb":
+            positions = lttb(x_all[rows], y_all[rows], n_points)
+        elif method == "minmax":
+            positions = min_max(x_all[rows], y_all[rows], n_points)
+        else:
+            raise ValueError(f"Unknown decimation method {method}")
+        keep.append(rows[positions])
+    if not keep:
+        return df
+    return df.iloc[np.sort(np.concatenate(keep))]
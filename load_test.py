@@ -0,0 +1,465 @@
+"""Load test for the app, many simulated students in one process.
+
+Each simulated session opens the websocket a browser would and speaks the
+server's own protobuf messages (BackMsg and ForwardMsg from streamlit.proto), so
+no browser is needed. Sessions follow a scripted flow: pick a dataset, switch
+through every display type in plotting_options, drag the sliders and toggle
+"Fit line". Every rerun is timed from sending the widget change until the
+server says the script finished.
+
+The flow is repeated at increasing numbers of concurrent sessions, and the p50,
+p95 and p99 rerun latency, the throughput and the memory of the server and its
+render workers at each level are written to a JSON file::
+
+    python load_test.py --sessions 1 4 8 16 32 --output load_test.json
+
+Without --url a server is started for the test and stopped afterwards.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import pathlib
+import argparse
+import datetime
+import subprocess
+import numpy as np
+import streamlit
+from collections import defaultdict
+from typing import Dict, List, Optional
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+# Endpoints moved under _stcore in newer Streamlit releases
+stream_paths = ["_stcore/stream", "stream"]
+health_paths = ["_stcore/health", "healthz"]
+message_paths = {"_stcore/stream": "_stcore/message", "stream": "message"}
+
+# ForwardMsg types that end a run, renamed along with reports in newer releases
+finished_types = {"report_finished", "script_finished"}
+
+widget_types = {
+    "checkbox",
+    "color_picker",
+    "multiselect",
+    "number_input",
+    "radio",
+    "selectbox",
+    "slider",
+    "text_input",
+}
+
+dataset_label = "Select dataset"
+display_label = "Select a display type"
+fit_line_label = "Fit line"
+
+
+def percentiles(values: List[float]) -> Dict:
+    """Returns the count, p50, p95, p99 and max of a list of latencies"""
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(max(values)), 4),
+    }
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Returns the resident memory in bytes of a process and all its children
+
+    Only works where /proc exists, None elsewhere.
+    """
+    proc = pathlib.Path("/proc")
+    if not proc.joinpath(str(pid)).exists():
+        return None
+    children = defaultdict(list)
+    for stat in proc.glob("[0-9]*/stat"):
+        try:
+            # The command name can contain spaces, the fields start after it
+            parent = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[parent].append(int(stat.parent.name))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            status = proc.joinpath(str(current), "status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1]) * 1024
+        stack.extend(children[current])
+    return total
+
+
+class Session:
+    """One simulated browser tab
+
+    Parameters
+    ----------
+    url : str
+        Address of the server, like http://localhost:8501
+    timeout : float
+        Seconds to wait for a rerun before giving up on the session
+    """
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self.error_messages = set()
+        self.widgets: Dict[str, object] = {}
+        self._states: Dict[str, object] = {}
+        self._messages: Dict[str, ForwardMsg] = {}
+        self._connection = None
+        self._message_path = None
+
+    async def connect(self):
+        """Opens the websocket and waits for the first run of the script"""
+        ws_url = self.url.replace("http", "ws", 1)
+        for path in stream_paths:
+            try:
+                self._connection = await websocket_connect(
+                    f"{ws_url}/{path}", max_message_size=1 << 30
+                )
+            except HTTPClientError:
+                continue
+            self._message_path = message_paths[path]
+            break
+        else:
+            raise ConnectionError(f"No Streamlit websocket at {self.url}")
+        await self.rerun("open app")
+
+    async def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+    async def rerun(self, interaction: str):
+        """Sends the current widget states and times the rerun they trigger"""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.widget_states.widgets.extend(self._states.values())
+        start = time.perf_counter()
+        await self._connection.write_message(message.SerializeToString(), binary=True)
+        widgets = {}
+        while True:
+            data = await asyncio.wait_for(self._connection.read_message(), self.timeout)
+            if data is None:
+                raise ConnectionError("The server closed the websocket")
+            forward = await self._resolve(ForwardMsg.FromString(data))
+            kind = forward.WhichOneof("type")
+            if kind == "new_report" or kind == "new_session":
+                # A new run started, only its widgets count
+                widgets = {}
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in widget_types:
+                    widget = getattr(element, element_type)
+                    widgets.setdefault(widget.label, widget)
+                elif element_type == "exception":
+                    self.errors += 1
+                    exception = element.exception
+                    self.error_messages.add(
+                        f"{exception.type}: {exception.message.splitlines()[0]}"
+                    )
+            elif kind == "session_event":
+                event = forward.session_event.WhichOneof("type") or ""
+                if event.startswith("script_compilation_exception"):
+                    self.errors += 1
+                    exception = forward.session_event.script_compilation_exception
+                    self.error_messages.add(
+                        f"{exception.type}: {exception.message.splitlines()[0]}"
+                    )
+            elif kind in finished_types:
+                break
+        self.latencies[interaction].append(time.perf_counter() - start)
+        self.widgets = widgets
+        current = {widget.id for widget in widgets.values()}
+        self._states = {
+            widget_id: state
+            for widget_id, state in self._states.items()
+            if widget_id in current
+        }
+
+    async def _resolve(self, forward: ForwardMsg) -> ForwardMsg:
+        """Swaps a reference to an already sent message for the message itself"""
+        if forward.WhichOneof("type") == "ref_hash":
+            cached = self._messages.get(forward.ref_hash)
+            if cached is None:
+                response = await AsyncHTTPClient().fetch(
+                    f"{self.url}/{self._message_path}?hash={forward.ref_hash}"
+                )
+                cached = ForwardMsg.FromString(response.body)
+            forward = cached
+        elif forward.hash:
+            self._messages[forward.hash] = forward
+        return forward
+
+    def options(self, label: str) -> List[str]:
+        widget = self.widgets.get(label)
+        return list(widget.options) if widget is not None else []
+
+    async def set(self, label: str, value, interaction: Optional[str] = None):
+        """Changes a widget like a user would and waits for the rerun
+
+        value is the option for selectboxes and radios, a list of options for
+        multiselects, a number or a list of numbers for sliders, and the plain value
+        for everything else.
+        """
+        widget = self.widgets[label]
+        element_type = type(widget).__name__
+        state = WidgetState(id=widget.id)
+        if element_type in ("Selectbox", "Radio"):
+            state.int_value = list(widget.options).index(value)
+        elif element_type == "Multiselect":
+            indices = [list(widget.options).index(option) for option in value]
+            state.int_array_value.data.extend(indices)
+        elif element_type == "Slider":
+            values = value if isinstance(value, (list, tuple)) else [value]
+            state.double_array_value.data.extend(values)
+        elif element_type == "Checkbox":
+            state.bool_value = bool(value)
+        elif element_type == "NumberInput":
+            state.double_value = float(value)
+        else:
+            state.string_value = str(value)
+        self._states[widget.id] = state
+        await self.rerun(interaction or f"{element_type.lower()}: {label}")
+
+
+def drag_values(widget, rng: random.Random, steps: int) -> List[float]:
+    """Returns the values a slider is released at while a student drags it"""
+    values = []
+    for _ in range(steps):
+        value = rng.uniform(widget.min, widget.max)
+        if widget.step:
+            value = widget.min + round((value - widget.min) / widget.step) * widget.step
+        values.append(min(max(value, widget.min), widget.max))
+    if len(widget.default) == 2:
+        return [
+            sorted([value, rng.uniform(widget.min, widget.max)]) for value in values
+        ]
+    return values
+
+
+async def student_flow(session: Session, rng: random.Random, think: float, drags: int):
+    """Picks a dataset, goes through every display type, drags sliders, fits lines"""
+    await session.connect()
+    await asyncio.sleep(rng.uniform(0, think))
+    datasets = session.options(dataset_label)
+    if datasets:
+        await session.set(dataset_label, rng.choice(datasets), "pick dataset")
+    for display in session.options(display_label):
+        await asyncio.sleep(rng.uniform(0, 2 * think))
+        await session.set(display_label, display, f"display: {display}")
+        sliders = [
+            label
+            for label, widget in session.widgets.items()
+            if type(widget).__name__ == "Slider"
+        ]
+        for label in sliders:
+            if label not in session.widgets:
+                # An earlier change removed it
+                continue
+            for value in drag_values(session.widgets[label], rng, drags):
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+                await session.set(label, value, "drag slider")
+        if fit_line_label in session.widgets:
+            for checked in (True, False):
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+                await session.set(fit_line_label, checked, "toggle fit line")
+    await session.close()
+
+
+async def sample_rss(pid: Optional[int], samples: List[int], interval: float = 0.5):
+    while pid is not None:
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def run_level(
+    url: str,
+    n_sessions: int,
+    pid: Optional[int],
+    think: float,
+    drags: int,
+    timeout: float,
+    seed: int,
+) -> Dict:
+    """Runs the flow in n_sessions concurrent sessions and summarises the reruns"""
+    sessions = [Session(url, timeout) for _ in range(n_sessions)]
+    rss_samples: List[int] = []
+    sampler = asyncio.ensure_future(sample_rss(pid, rss_samples))
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *[
+            student_flow(session, random.Random(seed + i), think, drags)
+            for i, session in enumerate(sessions)
+        ],
+        return_exceptions=True,
+    )
+    duration = time.perf_counter() - start
+    sampler.cancel()
+
+    by_interaction = defaultdict(list)
+    for session in sessions:
+        for interaction, latencies in session.latencies.items():
+            by_interaction[interaction].extend(latencies)
+    everything = [value for values in by_interaction.values() for value in values]
+    failed = [repr(outcome) for outcome in outcomes if isinstance(outcome, Exception)]
+    to_mb = lambda n: round(n / 1024**2, 1)
+    return {
+        "sessions": n_sessions,
+        "duration_s": round(duration, 3),
+        "reruns": len(everything),
+        "throughput_reruns_per_s": round(len(everything) / duration, 3),
+        "script_errors": sum(session.errors for session in sessions),
+        "script_error_messages": sorted(
+            set().union(*[session.error_messages for session in sessions])
+        )[:10],
+        "failed_sessions": len(failed),
+        "failures": failed[:10],
+        "latency_s": percentiles(everything),
+        "interactions": {
+            name: percentiles(values) for name, values in sorted(by_interaction.items())
+        },
+        "rss_mb": {
+            "start": to_mb(rss_samples[0]) if rss_samples else None,
+            "peak": to_mb(max(rss_samples)) if rss_samples else None,
+            "end": to_mb(rss_samples[-1]) if rss_samples else None,
+        },
+    }
+
+
+async def wait_for_server(url: str, timeout: float = 60.0):
+    client = AsyncHTTPClient()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for path in health_paths:
+            try:
+                await client.fetch(f"{url}/{path}")
+                return
+            except (HTTPClientError, OSError):
+                pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"The server at {url} didn't start within {timeout} s")
+
+
+def start_server(script: str, port: int) -> subprocess.Popen:
+    """Starts the app headless on the given port"""
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            script,
+            "--server.headless",
+            "true",
+            "--server.port",
+            str(port),
+            "--browser.gatherUsageStats",
+            "false",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def run(args) -> Dict:
+    server = None
+    url, pid = args.url, args.server_pid
+    if url is None:
+        server = start_server(args.script, args.port)
+        url, pid = f"http://localhost:{args.port}", server.pid
+    try:
+        await wait_for_server(url)
+        levels = []
+        for n_sessions in args.sessions:
+            level = await run_level(
+                url, n_sessions, pid, args.think, args.drags, args.timeout, args.seed
+            )
+            levels.append(level)
+            latency = level["latency_s"]
+            print(
+                f"{n_sessions:>4} sessions  {level['reruns']:>6} reruns  "
+                f"{level['throughput_reruns_per_s']:>7.2f}/s  "
+                f"p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  "
+                f"peak RSS {level['rss_mb']['peak']} MB  "
+                f"failed {level['failed_sessions']}"
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    return {
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "url": url,
+        "streamlit": streamlit.__version__,
+        "think_s": args.think,
+        "drags_per_slider": args.drags,
+        "seed": args.seed,
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="Concurrent sessions at each level",
+    )
+    parser.add_argument(
+        "--url", help="Server to test, a server is started for the test if not given"
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="Process id of the server given by --url"
+    )
+    parser.add_argument("--script", default="streamlit_app.py", help="App to start")
+    parser.add_argument(
+        "--port", type=int, default=8599, help="Port of the started app"
+    )
+    parser.add_argument(
+        "--think", type=float, default=0.5, help="Mean seconds between interactions"
+    )
+    parser.add_argument(
+        "--drags", type=int, default=1, help="Times each slider is moved"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120.0, help="Seconds before a rerun fails"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("load_test.json"),
+        help="JSON file for the results",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with args.output.open("w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
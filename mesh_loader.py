@@ -0,0 +1,470 @@
+"""Readers for the surface meshes in Meshes/ and a plotly Mesh3d view of them.
+
+Both readers memory-map the file and describe the vertex and face data with
+NumPy views onto it, so nothing is copied into Python lists. Binary glTF (.glb)
+accessors are mapped straight onto the BIN chunk using their bufferView offsets
+and strides; a copy is only made when a node transform has to be applied. The
+finished figure dict can be kept in the DiskCache under the sha1 of the
+file.
+"""
+
+import json
+import struct
+import pathlib
+import numpy as np
+import plotly.graph_objects as go
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from disk_cache import DiskCache, file_digest
+from figure_transport import plain_figure
+
+mesh_formats = [".ply", ".glb"]
+default_mesh_color = "#D9CBB0"
+
+_glb_magic = b"glTF"
+_chunk_json = 0x4E4F534A
+_chunk_bin = 0x004E4942
+
+_component_types = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+# MAT2 and MAT3 accessors need column padding and never hold positions, normals
+# or indices, so they are left out
+_type_sizes = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+_ply_types = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+
+_ply_face_lists = ["vertex_indices", "vertex_index"]
+
+
+def _lookup(table: Dict, key, what: str):
+    """Returns table[key], raising a ValueError the app can show if it's missing"""
+    try:
+        return table[key]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unsupported {what} {key!r}") from None
+
+
+@dataclass
+class Mesh:
+    """A triangle mesh
+
+    vertices is (n, 3), faces is (m, 3) indices into vertices and normals, when the
+    file has them, is (n, 3). The arrays may be read-only views onto the file.
+    """
+
+    name: str
+    vertices: np.ndarray
+    faces: np.ndarray
+    normals: Optional[np.ndarray] = None
+
+
+def read_glb(path: pathlib.Path) -> List[Mesh]:
+    """Reads every triangle primitive in a binary glTF file
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The .glb file
+
+    Returns
+    -------
+    List[Mesh]
+        One mesh per primitive, with its node transforms applied
+    """
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, version, length = struct.unpack_from("<4sII", data, 0)
+    if magic != _glb_magic or version != 2:
+        raise ValueError(f"{path} is not a glTF 2.0 binary file")
+
+    gltf, bin_offset, offset = None, None, 12
+    while offset < min(length, len(data)):
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        if chunk_type == _chunk_json:
+            gltf = json.loads(bytes(data[offset + 8 : offset + 8 + chunk_length]))
+        elif chunk_type == _chunk_bin and bin_offset is None:
+            bin_offset = offset + 8
+        offset += 8 + chunk_length
+    if gltf is None:
+        raise ValueError(f"{path} has no JSON chunk")
+
+    def accessor(index: int) -> np.ndarray:
+        spec = gltf["accessors"][index]
+        if "sparse" in spec:
+            raise ValueError("Sparse accessors aren't supported")
+        dtype = np.dtype(
+            _lookup(_component_types, spec["componentType"], "component type")
+        )
+        width = _lookup(_type_sizes, spec["type"], "accessor type")
+        shape = (spec["count"], width) if width > 1 else (spec["count"],)
+        if "bufferView" not in spec:
+            return np.zeros(shape, dtype=dtype)
+        view = gltf["bufferViews"][spec["bufferView"]]
+        if view.get("buffer", 0) != 0 or bin_offset is None:
+            raise ValueError("Only data in the GLB binary chunk is supported")
+        stride = view.get("byteStride") or dtype.itemsize * width
+        strides = (stride, dtype.itemsize) if width > 1 else (stride,)
+        start = bin_offset + view.get("byteOffset", 0) + spec.get("byteOffset", 0)
+        if spec["count"] and start + (
+            spec["count"] - 1
+        ) * stride + dtype.itemsize * width > len(data):
+            raise ValueError(f"Accessor {index} reaches past the end of the file")
+        return np.ndarray(
+            shape=shape, dtype=dtype, buffer=data, offset=start, strides=strides
+        )
+
+    meshes = []
+    for node_index, transform in _scene_nodes(gltf):
+        node = gltf["nodes"][node_index]
+        mesh_spec = gltf["meshes"][node["mesh"]]
+        name = mesh_spec.get("name") or node.get("name") or f"mesh {node['mesh']}"
+        for primitive in mesh_spec["primitives"]:
+            attributes = primitive["attributes"]
+            if "POSITION" not in attributes:
+                continue
+            vertices = accessor(attributes["POSITION"])
+            if "indices" in primitive:
+                indices = accessor(primitive["indices"])
+            else:
+                indices = np.arange(len(vertices))
+            faces = _triangles(indices, primitive.get("mode", 4))
+            if faces is None:
+                # Points and lines have no surface to draw
+                continue
+            normals = None
+            if "NORMAL" in attributes:
+                normals = accessor(attributes["NORMAL"])
+            if not np.allclose(transform, np.eye(4)):
+                vertices = vertices @ transform[:3, :3].T + transform[:3, 3]
+                if normals is not None:
+                    normals = normals @ np.linalg.inv(transform[:3, :3])
+                    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+            meshes.append(Mesh(name, vertices, faces, normals))
+    return meshes
+
+
+def _triangles(indices: np.ndarray, mode: int) -> Optional[np.ndarray]:
+    """Returns (m, 3) faces from a primitive's indices and drawing mode"""
+    if mode == 4:
+        return indices.reshape(-1, 3)
+    if mode == 5:
+        # Strip, every other triangle is flipped to keep the winding
+        n = len(indices) - 2
+        faces = np.stack([indices[:n], indices[1 : n + 1], indices[2 : n + 2]], 1)
+        faces[1::2, [0, 1]] = faces[1::2, [1, 0]]
+        return faces
+    if mode == 6:
+        n = len(indices) - 2
+        return np.stack(
+            [np.repeat(indices[0], n), indices[1 : n + 1], indices[2 : n + 2]], 1
+        )
+    return None
+
+
+def _node_matrix(node: Dict) -> np.ndarray:
+    if "matrix" in node:
+        return np.asarray(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get("rotation", [0.0, 0.0, 0.0, 1.0])
+    rotation = np.array(
+        [
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ]
+    )
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.asarray(node.get("scale", [1.0, 1.0, 1.0]))
+    matrix[:3, 3] = node.get("translation", [0.0, 0.0, 0.0])
+    return matrix
+
+
+def _scene_nodes(gltf: Dict):
+    """Yields each node with a mesh and its world transform"""
+    scenes = gltf.get("scenes")
+    if scenes:
+        roots = scenes[gltf.get("scene", 0)].get("nodes", [])
+    else:
+        roots = range(len(gltf.get("nodes", [])))
+    stack = [(index, np.eye(4)) for index in roots]
+    while stack:
+        index, parent = stack.pop()
+        node = gltf["nodes"][index]
+        transform = parent @ _node_matrix(node)
+        if "mesh" in node:
+            yield index, transform
+        stack.extend((child, transform) for child in node.get("children", []))
+
+
+def _ply_header(data: np.ndarray) -> Tuple[List[str], int]:
+    """Returns the header lines of a PLY file and the offset of its data"""
+    if bytes(data[:3]) != b"ply":
+        raise ValueError("Not a PLY file")
+    size = 4096
+    while True:
+        head = bytes(data[:size])
+        header_end = head.find(b"end_header")
+        if header_end >= 0 and head.find(b"\n", header_end) >= 0:
+            header_length = head.index(b"\n", header_end) + 1
+            lines = head[:header_length].decode("ascii", errors="replace")
+            return lines.splitlines(), header_length
+        if size >= len(data):
+            raise ValueError("The PLY header has no end_header")
+        size *= 2
+
+
+def _ply_dtype(
+    element: Dict, byte_order: str, data: np.ndarray, offset: int
+) -> Tuple[np.dtype, Dict[str, str]]:
+    """Returns the record dtype of a PLY element and the count field of each list
+
+    Records can only be viewed in place if every list of a property has the same
+    length, so the lengths are read from the first record and checked against
+    the rest by the caller.
+    """
+    fields, lists = [], {}
+    position = offset
+    for prop in element["props"]:
+        if prop[0] == "list":
+            _, count_type, item_type, name = prop
+            count_dtype = np.dtype(
+                byte_order + _lookup(_ply_types, count_type, "PLY type")
+            )
+            item_dtype = np.dtype(
+                byte_order + _lookup(_ply_types, item_type, "PLY type")
+            )
+            length = 0
+            if element["count"]:
+                if position + count_dtype.itemsize > len(data):
+                    raise ValueError("The file is shorter than its header says")
+                length = int(np.frombuffer(data, count_dtype, 1, position)[0])
+            lists[name] = f"{name} count"
+            fields.append((lists[name], count_dtype))
+            fields.append((name, item_dtype, (length,)))
+            position += count_dtype.itemsize + item_dtype.itemsize * length
+        else:
+            dtype = np.dtype(byte_order + _lookup(_ply_types, prop[0], "PLY type"))
+            fields.append((prop[1], dtype))
+            position += dtype.itemsize
+    return np.dtype(fields), lists
+
+
+def read_ply(path: pathlib.Path) -> List[Mesh]:
+    """Reads a binary PLY file with triangle faces
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The .ply file
+
+    Returns
+    -------
+    List[Mesh]
+        A single mesh
+    """
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    lines, header_length = _ply_header(data)
+
+    elements, byte_order = [], None
+    for line in lines:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "format":
+            if words[1] == "ascii":
+                raise ValueError("ASCII PLY files aren't supported")
+            byte_order = "<" if words[1] == "binary_little_endian" else ">"
+        elif words[0] == "element":
+            elements.append({"name": words[1], "count": int(words[2]), "props": []})
+        elif words[0] == "property" and elements:
+            elements[-1]["props"].append(words[1:])
+    if byte_order is None:
+        raise ValueError(f"{path} has no PLY format line")
+
+    offset = header_length
+    vertices, normals, faces = None, None, None
+    for element in elements:
+        dtype, lists = _ply_dtype(element, byte_order, data, offset)
+        if offset + dtype.itemsize * element["count"] > len(data):
+            raise ValueError("The file is shorter than its header says")
+        records = np.ndarray(
+            (element["count"],), dtype=dtype, buffer=data, offset=offset
+        )
+        offset += dtype.itemsize * element["count"]
+
+        if element["name"] == "face" and lists:
+            name = next((name for name in _ply_face_lists if name in lists), None)
+            name = name or next(iter(lists))
+            if dtype[name].shape != (3,) or not np.all(records[lists[name]] == 3):
+                raise ValueError("Only triangle faces are supported")
+            faces = records[name]
+        for name, count_field in lists.items():
+            if not np.all(records[count_field] == dtype[name].shape[0]):
+                # The records after the first one aren't where the dtype says
+                raise ValueError(
+                    f"Lists of different lengths in {element['name']} {name} "
+                    "aren't supported"
+                )
+        if element["name"] == "vertex":
+            if not {"x", "y", "z"} <= set(dtype.names):
+                raise ValueError(f"{path} has no vertex positions")
+            vertices = _field_view(records, ["x", "y", "z"])
+            if {"nx", "ny", "nz"} <= set(dtype.names):
+                normals = _field_view(records, ["nx", "ny", "nz"])
+
+    if vertices is None or faces is None:
+        raise ValueError(f"{path} has no vertices or faces")
+    return [Mesh(pathlib.Path(path).name, vertices, faces, normals)]
+
+
+def _field_view(records: np.ndarray, names: List[str]) -> np.ndarray:
+    """Returns three same-typed, adjacent record fields as an (n, 3) view"""
+    fields = records.dtype.fields
+    dtype = fields[names[0]][0]
+    start = fields[names[0]][1]
+    adjacent = all(
+        fields[name][0] == dtype and fields[name][1] == start + i * dtype.itemsize
+        for i, name in enumerate(names)
+    )
+    if not adjacent:
+        return np.stack([records[name] for name in names], axis=1)
+    return np.ndarray(
+        shape=(len(records), 3),
+        dtype=dtype,
+        buffer=records,
+        offset=start,
+        strides=(records.dtype.itemsize, dtype.itemsize),
+    )
+
+
+def load_mesh(path: pathlib.Path) -> List[Mesh]:
+    """Reads a mesh file, picking the reader from the file extension
+
+    Raises
+    ------
+    ValueError
+        If the file can't be read, including when it is truncated or malformed
+    """
+    suffix = pathlib.Path(path).suffix.lower()
+    readers = {".glb": read_glb, ".ply": read_ply}
+    if suffix not in readers:
+        raise ValueError(f"Unsupported mesh format {suffix}")
+    try:
+        return readers[suffix](path)
+    except (KeyError, IndexError, struct.error) as error:
+        raise ValueError(
+            f"{pathlib.Path(path).name} is malformed: {error!r}"
+        ) from error
+
+
+def mesh_figure(
+    meshes: List[Mesh], color: str = "lightgrey", opacity: float = 1.0
+) -> go.Figure:
+    """Returns a plotly figure with one Mesh3d trace per mesh
+
+    Parameters
+    ----------
+    meshes : List[Mesh]
+        The meshes to draw
+    color : str
+        Surface colour
+    opacity : float
+        Surface opacity between 0 and 1
+
+    Returns
+    -------
+    go.Figure
+        The figure, with the axes scaled to the data
+    """
+    fig = go.Figure()
+    for mesh in meshes:
+        fig.add_trace(
+            go.Mesh3d(
+                x=mesh.vertices[:, 0],
+                y=mesh.vertices[:, 1],
+                z=mesh.vertices[:, 2],
+                i=mesh.faces[:, 0],
+                j=mesh.faces[:, 1],
+                k=mesh.faces[:, 2],
+                name=mesh.name,
+                color=color,
+                opacity=opacity,
+                flatshading=False,
+            )
+        )
+    fig.update_layout(scene={"aspectmode": "data"})
+    return fig
+
+
+def mesh_payload(path: pathlib.Path, disk_cache: Optional[DiskCache] = None) -> Dict:
+    """Returns the figure dict of a mesh file, from the disk cache if it's there
+
+    The figure is built with the default colour and cached per file contents only,
+    use style_mesh to change the colour and opacity.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The .ply or .glb file
+    disk_cache : Optional[DiskCache]
+        Persistent cache for the figure
+
+    Returns
+    -------
+    Dict
+        A figure dict that st.plotly_chart accepts
+    """
+
+    def build() -> Dict:
+        return plain_figure(mesh_figure(load_mesh(path), color=default_mesh_color))
+
+    if disk_cache is None:
+        return build()
+    return disk_cache.get_or_compute(disk_cache.key("mesh", file_digest(path)), build)
+
+
+def style_mesh(
+    payload: Dict, color: str = default_mesh_color, opacity: float = 1.0
+) -> Dict:
+    """Returns a copy of a mesh figure dict with another colour and opacity
+
+    Only the trace dicts are copied, the vertex and face arrays are shared with
+    payload, which is left unchanged.
+
+    Parameters
+    ----------
+    payload : Dict
+        Figure dict from mesh_payload
+    color : str
+        Surface colour
+    opacity : float
+        Surface opacity between 0 and 1
+
+    Returns
+    -------
+    Dict
+        The restyled figure dict
+    """
+    data = [dict(trace, color=color, opacity=opacity) for trace in payload["data"]]
+    return dict(payload, data=data)
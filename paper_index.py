@@ -0,0 +1,230 @@
+"""Full-text search over the papers that ship in Data/.
+
+The text of each PDF is extracted once and stored with its inverted index in a
+JSON file named after the PDF's sha1, so restarts and unchanged files skip the
+extraction. Page images are only rendered when someone opens the page, and the
+most recent ones are kept in an LRU cache instead of sending the whole PDF to
+the browser.
+"""
+
+import re
+import json
+import math
+import pathlib
+import threading
+import pymupdf
+from functools import lru_cache
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from disk_cache import default_cache_dir, file_digest
+
+default_index_dir = default_cache_dir.joinpath("papers")
+index_format = 1
+
+_token = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower case words and numbers, the terms the index is built from"""
+    return _token.findall(text.lower())
+
+
+@dataclass
+class SearchHit:
+    """A page that matches a query"""
+
+    paper: str
+    page: int
+    score: float
+    snippet: str
+
+
+@lru_cache(maxsize=32)
+def render_page(path: str, digest: str, page: int, zoom: float = 1.5) -> bytes:
+    """Returns one page of a PDF as PNG bytes
+
+    Parameters
+    ----------
+    path : str
+        The PDF
+    digest : str
+        sha1 of the PDF, part of the cache key so an edited file is rendered again
+    page : int
+        Page number, starting at 0
+    zoom : float
+        Scale relative to 72 dpi
+
+    Returns
+    -------
+    bytes
+        The page as a PNG
+    """
+    with pymupdf.open(path) as document:
+        pixmap = document[page].get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+        return pixmap.tobytes("png")
+
+
+class PaperIndex:
+    """Inverted index of the words on every page of a set of PDFs
+
+    Parameters
+    ----------
+    index_dir : pathlib.Path
+        Where the extracted text and postings of each PDF are kept
+    """
+
+    def __init__(self, index_dir: pathlib.Path = default_index_dir):
+        self.index_dir = pathlib.Path(index_dir)
+        self._lock = threading.Lock()
+        self._papers: Dict[str, Dict] = {}
+        # term -> paper -> page -> count
+        self._postings: Dict[str, Dict[str, Dict[int, int]]] = defaultdict(dict)
+        self._n_pages = 0
+
+    def _extract(self, path: pathlib.Path, digest: str) -> Dict:
+        """Reads the stored index of a PDF, building it if this version is new"""
+        stored = self.index_dir.joinpath(f"{digest}.json")
+        if stored.exists():
+            with stored.open() as open_file:
+                entry = json.load(open_file)
+            if entry.get("format") == index_format:
+                return entry
+
+        with pymupdf.open(path) as document:
+            pages = [page.get_text() for page in document]
+        postings = defaultdict(dict)
+        for number, text in enumerate(pages):
+            for term, count in Counter(tokenize(text)).items():
+                postings[term][number] = count
+        entry = {"format": index_format, "pages": pages, "postings": postings}
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        partial = stored.with_suffix(".part")
+        with partial.open("w") as open_file:
+            json.dump(entry, open_file)
+        partial.replace(stored)
+        return entry
+
+    def add(self, name: str, path: pathlib.Path):
+        """Adds a PDF to the index, replacing any earlier version of it"""
+        digest = file_digest(path)
+        with self._lock:
+            if self._papers.get(name, {}).get("digest") == digest:
+                return
+        entry = self._extract(path, digest)
+        with self._lock:
+            self._remove(name)
+            self._papers[name] = {
+                "path": str(path),
+                "digest": digest,
+                "pages": entry["pages"],
+            }
+            self._n_pages += len(entry["pages"])
+            for term, pages in entry["postings"].items():
+                self._postings[term][name] = {
+                    int(page): count for page, count in pages.items()
+                }
+
+    def _remove(self, name: str):
+        paper = self._papers.pop(name, None)
+        if paper is None:
+            return
+        self._n_pages -= len(paper["pages"])
+        for term in list(self._postings):
+            self._postings[term].pop(name, None)
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def remove(self, name: str):
+        with self._lock:
+            self._remove(name)
+
+    def papers(self) -> List[str]:
+        with self._lock:
+            return sorted(self._papers)
+
+    def page_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._papers[name]["pages"])
+
+    def page_image(self, name: str, page: int, zoom: float = 1.5) -> bytes:
+        """Returns a page of a paper as PNG bytes, rendered on first use"""
+        with self._lock:
+            paper = self._papers[name]
+        return render_page(paper["path"], paper["digest"], page, zoom)
+
+    def search(self, query: str, limit: int = 10) -> List[SearchHit]:
+        """Returns the pages containing every word of the query, best matches first
+
+        Parameters
+        ----------
+        query : str
+            Words to look for
+        limit : int
+            Maximum number of pages to return
+
+        Returns
+        -------
+        List[SearchHit]
+            Pages ranked by tf-idf
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            matches = None
+            scores = Counter()
+            for term in terms:
+                postings = self._postings.get(term, {})
+                pages = {
+                    (paper, page): count
+                    for paper, counts in postings.items()
+                    for page, count in counts.items()
+                }
+                if not pages:
+                    return []
+                idf = math.log(1 + self._n_pages / len(pages))
+                for key, count in pages.items():
+                    scores[key] += (1 + math.log(count)) * idf
+                matches = set(pages) if matches is None else matches & set(pages)
+            ranked = sorted(matches, key=lambda key: -scores[key])[:limit]
+            return [
+                SearchHit(
+                    paper=paper,
+                    page=page,
+                    score=scores[(paper, page)],
+                    snippet=_snippet(self._papers[paper]["pages"][page], terms),
+                )
+                for paper, page in ranked
+            ]
+
+    def paper_for_dataset(self, dataset: str) -> Optional[str]:
+        """Returns the paper a dataset comes from, matched on the leading author words
+
+        'Shaw and Ryan - Limb length dataset 1' matches 'Shaw and Ryan, 2012' and
+        'Powell Data - BrainSize vs BodySize' matches 'Powell et al., 2017'.
+        """
+        dataset_terms = tokenize(dataset)
+        best, best_length = None, 0
+        for paper in self.papers():
+            length = 0
+            for dataset_term, paper_term in zip(dataset_terms, tokenize(paper)):
+                if dataset_term != paper_term:
+                    break
+                length += 1
+            if length > best_length:
+                best, best_length = paper, length
+        return best
+
+
+def _snippet(text: str, terms: List[str], width: int = 90) -> str:
+    """Returns the text around the first query word on a page"""
+    flat = " ".join(text.split())
+    match = re.search("|".join(re.escape(term) for term in terms), flat.lower())
+    if match is None:
+        return flat[: 2 * width]
+    start = max(0, match.start() - width)
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if match.end() + width < len(flat) else ""
+    return prefix + flat[start : match.end() + width] + suffix
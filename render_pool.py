@@ -0,0 +1,416 @@
+"""Process pool for building plotly figures outside of the Streamlit process.
+
+Every session of the app shares one interpreter, so a slow figure (LOWESS fits,
+violin KDEs, large 3d scatters) blocks everyone else while it holds the GIL. The
+pool moves that work into worker processes. Datasets are written once to a
+store of memory-mapped ``.npy`` columns, so a job only carries the dataset id,
+the name of the plotly express function and its arguments, and the workers
+send back the figure as JSON. Publishing a dataset marks it as used, and once
+the store grows past its size limit the datasets used longest ago are removed.
+With a DiskCache that JSON is also kept on disk, keyed by the dataset id and the
+arguments, so the same figure is only built once across restarts and app
+processes.
+"""
+
+import os
+import time
+import json
+import hashlib
+import shutil
+import sqlite3
+import pathlib
+import tempfile
+import numpy as np
+import pandas as pd
+import multiprocessing
+import plotly.io as pio
+import plotly.express as px
+import plotly.graph_objects as go
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+from disk_cache import DiskCache
+
+default_store = pathlib.Path(tempfile.gettempdir()).joinpath("csats_render_store")
+default_store_bytes = 1024**3
+
+# Datasets used more recently than this are never removed, a queued job may need them
+_keep_seconds = 600
+
+# Plotly express functions a job is allowed to call
+renderers = {
+    "box": px.box,
+    "histogram": px.histogram,
+    "line": px.line,
+    "pie": px.pie,
+    "scatter": px.scatter,
+    "scatter_3d": px.scatter_3d,
+    "violin": px.violin,
+}
+
+# Datasets already opened by this worker, most recently used last
+_open_datasets = OrderedDict()
+_max_open_datasets = 8
+
+
+def dataset_id(df: pd.DataFrame) -> str:
+    """Returns a content hash used to name a dataset in the store
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataset
+
+    Returns
+    -------
+    str
+        Hex digest that changes whenever the values, columns or dtypes change
+    """
+    digest = hashlib.sha1()
+    digest.update(
+        repr([(name, str(dtype)) for name, dtype in df.dtypes.items()]).encode()
+    )
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def write_dataset(df: pd.DataFrame, store: pathlib.Path = default_store) -> str:
+    """Writes a dataset to the store as one ``.npy`` file per column
+
+    Numeric, boolean and datetime columns are saved as they are. Everything else
+    is saved as integer codes plus a list of the unique values.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataset
+    store : pathlib.Path
+        Folder holding the datasets
+
+    Returns
+    -------
+    str
+        The id of the dataset in the store
+    """
+    data_id = dataset_id(df)
+    target = pathlib.Path(store).joinpath(data_id)
+    try:
+        # The manifest's modification time records when the dataset was last used
+        os.utime(target.joinpath("manifest.json"))
+        return data_id
+    except FileNotFoundError:
+        pass
+
+    pathlib.Path(store).mkdir(parents=True, exist_ok=True)
+    staging = pathlib.Path(tempfile.mkdtemp(dir=store, prefix=f".{data_id}-"))
+    columns = []
+    for position, (name, values) in enumerate(df.items()):
+        file_name = f"col_{position}.npy"
+        if values.dtype.kind in "biufcM":
+            np.save(staging.joinpath(file_name), values.to_numpy())
+            columns.append({"name": name, "file": file_name})
+        else:
+            codes, uniques = pd.factorize(values)
+            np.save(staging.joinpath(file_name), codes.astype(np.int32))
+            columns.append(
+                {"name": name, "file": file_name, "values": uniques.tolist()}
+            )
+    with staging.joinpath("manifest.json").open("w") as manifest:
+        json.dump({"columns": columns}, manifest, default=str)
+
+    try:
+        os.replace(staging, target)
+    except OSError:
+        # Another session published the same dataset first
+        shutil.rmtree(staging, ignore_errors=True)
+    return data_id
+
+
+def prune_store(
+    store: pathlib.Path = default_store, max_bytes: int = default_store_bytes
+) -> List[str]:
+    """Removes the datasets used longest ago until the store fits its size limit
+
+    Datasets used in the last ten minutes are kept whatever the size, and folders
+    left behind by interrupted writes are removed once they are as old.
+
+    Parameters
+    ----------
+    store : pathlib.Path
+        Folder holding the datasets
+    max_bytes : int
+        Size the store should be brought under
+
+    Returns
+    -------
+    List[str]
+        The ids of the removed datasets
+    """
+    store = pathlib.Path(store)
+    if not store.exists():
+        return []
+    now = time.time()
+    datasets, total = [], 0
+    for folder in store.iterdir():
+        try:
+            if folder.name.startswith("."):
+                if now - folder.stat().st_mtime > _keep_seconds:
+                    shutil.rmtree(folder, ignore_errors=True)
+                continue
+            used = folder.joinpath("manifest.json").stat().st_mtime
+            size = sum(path.stat().st_size for path in folder.iterdir())
+        except OSError:
+            # Removed by another process while looking
+            continue
+        datasets.append((used, size, folder))
+        total += size
+
+    removed = []
+    for used, size, folder in sorted(datasets):
+        if total <= max_bytes or now - used < _keep_seconds:
+            break
+        shutil.rmtree(folder, ignore_errors=True)
+        removed.append(folder.name)
+        total -= size
+    return removed
+
+
+def read_dataset(data_id: str, store: pathlib.Path = default_store) -> pd.DataFrame:
+    """Opens a dataset from the store, memory-mapping the numeric columns
+
+    Parameters
+    ----------
+    data_id : str
+        The id returned by write_dataset
+    store : pathlib.Path
+        Folder holding the datasets
+
+    Returns
+    -------
+    pd.DataFrame
+        The dataset
+    """
+    if data_id in _open_datasets:
+        _open_datasets.move_to_end(data_id)
+        return _open_datasets[data_id]
+
+    folder = pathlib.Path(store).joinpath(data_id)
+    with folder.joinpath("manifest.json").open() as manifest:
+        columns = json.load(manifest)["columns"]
+    data = {}
+    for column in columns:
+        values = np.load(folder.joinpath(column["file"]), mmap_mode="r")
+        if "values" in column:
+            uniques = np.asarray(column["values"] + [np.nan], dtype=object)
+            values = uniques[values]
+        data[column["name"]] = values
+    # Without copy=False pandas copies every column out of the memory map
+    df = pd.DataFrame(data, columns=[column["name"] for column in columns], copy=False)
+
+    _open_datasets[data_id] = df
+    if len(_open_datasets) > _max_open_datasets:
+        _open_datasets.popitem(last=False)
+    return df
+
+
+def build_figure(
+    data_id: str,
+    renderer: str,
+    px_args: Dict,
+    layout_args: Optional[Dict] = None,
+    trace_args: Optional[Dict] = None,
+    as_str: Iterable[str] = (),
+    store: pathlib.Path = default_store,
+) -> str:
+    """Builds a figure from a stored dataset, this is what runs in the workers
+
+    Parameters
+    ----------
+    data_id : str
+        The id of the dataset in the store
+    renderer : str
+        Key of the plotly express function in renderers
+    px_args : Dict
+        Keyword arguments for the plotly express function, columns are given by name
+    layout_args : Optional[Dict]
+        Passed to fig.update_layout
+    trace_args : Optional[Dict]
+        Passed to fig.update_traces
+    as_str : Iterable[str]
+        Names of px_args whose column should be converted to text first, so numbers are
+        treated as discrete groups
+    store : pathlib.Path
+        Folder holding the datasets
+
+    Returns
+    -------
+    str
+        The figure as plotly JSON
+    """
+    df = read_dataset(data_id, store)
+    px_args = dict(px_args)
+    for arg in as_str:
+        if px_args.get(arg) is not None:
+            px_args[arg] = df[px_args[arg]].astype(str)
+    fig = renderers[renderer](df, **px_args)
+    if trace_args:
+        fig.update_traces(**trace_args)
+    if layout_args:
+        fig.update_layout(**layout_args)
+    return fig.to_json()
+
+
+def timed_build_figure(*args, **kwargs) -> Tuple[str, float]:
+    """Runs build_figure and returns the figure JSON with the CPU seconds it used"""
+    start = time.process_time()
+    fig_json = build_figure(*args, **kwargs)
+    return fig_json, time.process_time() - start
+
+
+class RenderPool:
+    """Worker processes that build figures from datasets in a shared store
+
+    Parameters
+    ----------
+    max_workers : Optional[int]
+        Number of worker processes, defaults to the number of cores
+    store : pathlib.Path
+        Folder holding the memory-mapped datasets
+    max_store_bytes : int
+        Size of the store before the datasets used longest ago are removed
+    disk_cache : Optional[DiskCache]
+        Persistent cache for the built figures
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        store: pathlib.Path = default_store,
+        max_store_bytes: int = default_store_bytes,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.store = pathlib.Path(store)
+        self.max_store_bytes = max_store_bytes
+        self.disk_cache = disk_cache
+        self._executor = None
+        self._pruned = 0.0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._executor is None:
+            try:
+                # Forking a threaded server is unsafe, so the workers start fresh
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            except (OSError, NotImplementedError):
+                return None
+        return self._executor
+
+    def restart(self):
+        """Drops a pool whose workers died, the next job starts new workers"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def publish(self, df: pd.DataFrame) -> str:
+        """Writes a dataset to the store if it isn't there yet and returns its id
+
+        Call it on every rerun that uses the dataset, it marks the dataset as used
+        so it isn't removed from the store while sessions still need it.
+        """
+        data_id = write_dataset(df, self.store)
+        if time.monotonic() - self._pruned > 60:
+            self._pruned = time.monotonic()
+            prune_store(self.store, self.max_store_bytes)
+        return data_id
+
+    def submit(
+        self,
+        data_id: str,
+        renderer: str,
+        px_args: Dict,
+        layout_args: Optional[Dict] = None,
+        trace_args: Optional[Dict] = None,
+        as_str: Iterable[str] = (),
+        local: bool = False,
+    ) -> Future:
+        """Queues a figure build
+
+        The future resolves to the figure JSON and the CPU seconds the build took,
+        0 when the figure came from the disk cache. local builds the figure in this
+        process, which is what happens when the pool can't be started or one of its
+        workers died. A future whose worker died raises BrokenProcessPool.
+        """
+        if renderer not in renderers:
+            raise ValueError(f"Unknown renderer {renderer}")
+        job = (data_id, renderer, px_args, layout_args, trace_args, tuple(as_str))
+        key = None
+        if self.disk_cache is not None:
+            key = self.disk_cache.key("figure", *job)
+            fig_json = self.disk_cache.get(key)
+            if fig_json is not None:
+                future = Future()
+                future.set_result((fig_json, 0.0))
+                return future
+
+        future = None
+        executor = None if local else self._get_executor()
+        if executor is not None:
+            try:
+                future = executor.submit(timed_build_figure, *job, store=self.store)
+            except BrokenProcessPool:
+                self.restart()
+        if future is None:
+            # Without a pool the figure is built in this process
+            future = Future()
+            try:
+                future.set_result(timed_build_figure(*job, store=self.store))
+            except Exception as error:
+                future.set_exception(error)
+        if key is not None:
+            future.add_done_callback(lambda done: self._store_figure(key, done))
+        return future
+
+    def _store_figure(self, key: str, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            self.disk_cache.put(key, future.result()[0])
+        except (OSError, sqlite3.Error):
+            # A full or locked cache shouldn't fail the figure
+            pass
+
+    def map(self, fn, *iterables):
+        """Runs fn over the iterables in the workers, like the builtin map
+
+        fn has to be a module level function so the workers can import it.
+        """
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                return list(executor.map(fn, *iterables))
+            except BrokenProcessPool:
+                self.restart()
+        return list(map(fn, *iterables))
+
+    def render(self, data_id: str, renderer: str, px_args: Dict, **kwargs) -> go.Figure:
+        """Builds a figure in a worker and waits for it
+
+        Exceptions raised while building the figure, like a ValueError for a column
+        with missing values, are raised here.
+        """
+        try:
+            fig_json, _ = self.submit(data_id, renderer, px_args, **kwargs).result()
+        except BrokenProcessPool:
+            # A worker died, new ones are started for the next job
+            self.restart()
+            fig_json, _ = self.submit(
+                data_id, renderer, px_args, local=True, **kwargs
+            ).result()
+        return pio.from_json(fig_json)
+
+    def shutdown(self):
+        self.restart()
@@ -2,6 +2,7 @@ import git
 import base64
 import pathlib
 import requests
+import numpy as np
 import matplotlib
 import pandas as pd
 import altair as alt
@@ -10,8 +11,22 @@ import plotly.express as px
 import plotly.graph_objects as go
 import plotly.figure_factory as ff
 import streamlit.components.v1 as components
+from streamlit.report_thread import get_report_ctx
+from streamlit.server.server import Server, _BrowserWebSocketHandler
 from typing import Dict, Tuple, Union
 from matplotlib import cm
+from line_decimation import decimate_line_data, decimation_methods
+from render_pool import RenderPool, dataset_id
+from figure_jobs import FigureJobs
+from figure_transport import browser_figure, compressed_bytes, payload_bytes
+from dataset_catalogue import DatasetCatalogue
+from asset_cache import AssetCache
+from paper_index import PaperIndex
+from mesh_loader import default_mesh_color, mesh_formats, mesh_payload, style_mesh
+from derived_columns import DerivedColumnCache
+from allometry import fit_groups, fit_types
+from correlation import CorrelationStore, downsample
+from disk_cache import DiskCache
 
 # Page athestics
 current_dir = pathlib.Path.cwd()
@@ -20,6 +35,7 @@ psu_logo = (
     "https://www.underconsideration.com/brandnew/archives/penn_state_logo_detail.png"
 )
 workshop_logo = "https://www.csats.psu.edu/assets/uploads/csats-logo-new.jpg"
+workshop_logo_file = pathlib.Path("visuals").joinpath("workshop_logo.png")
 workshop_icon = (
     "http://equity.psu.edu/communications-marketing/assets/psugoogle250p.jpg"
 )
@@ -44,13 +60,24 @@ plotting_options = [
     "Histograms",
     "Pie charts",
     "Joyplot",
+    "Allometry",
+    "Correlation explorer",
+    "Mesh viewer",
     "Aleph viewer",
 ]
 
 
+@st.cache(allow_output_mutation=True, show_spinner=False)
+def get_asset_cache() -> AssetCache:
+    """Returns the in-memory copies of the logos shared by every session"""
+    return AssetCache()
+
+
+page_icon = get_asset_cache().get(workshop_icon, width=64)
+
 st.set_page_config(
     page_title="CSATS Morphosource workshop",
-    page_icon=workshop_icon,
+    page_icon=page_icon.image() if page_icon else workshop_icon,
     layout="wide",
     initial_sidebar_state="auto",
 )
@@ -69,7 +96,60 @@ def get_CASTS_data_repo():
             pass
 
 
-# @st.cache(suppress_st_warning=True)
+@st.cache(allow_output_mutation=True)
+def get_disk_cache() -> DiskCache:
+    """Returns the on-disk cache shared by restarts and every process on this host"""
+    return DiskCache()
+
+
+@st.cache(allow_output_mutation=True)
+def get_dataset_catalogue() -> DatasetCatalogue:
+    """Returns the catalogue of the Data folder shared by every session"""
+    return DatasetCatalogue(disk_cache=get_disk_cache())
+
+
+@st.cache(allow_output_mutation=True)
+def get_paper_index() -> PaperIndex:
+    """Returns the search index of the papers in the Data folder
+
+    The index follows its own catalogue of the PDFs, so an added or replaced paper
+    is indexed again without a restart.
+    """
+    papers = DatasetCatalogue(pattern="*.pdf")
+    index = PaperIndex()
+
+    def update(name: str):
+        try:
+            if name in papers.files():
+                index.add(name, papers.path(name))
+            else:
+                index.remove(name)
+        except (OSError, RuntimeError):
+            # Unreadable or half written PDF, it's indexed again on the next change
+            index.remove(name)
+
+    for name in papers.files():
+        update(name)
+    papers.subscribe(update)
+    return index
+
+
+@st.cache(allow_output_mutation=True)
+def get_derived_columns() -> DerivedColumnCache:
+    """Returns the cache of derived columns, emptied for a dataset when its file changes"""
+    derived_columns = DerivedColumnCache()
+    get_dataset_catalogue().subscribe(derived_columns.invalidate)
+    return derived_columns
+
+
+@st.cache(allow_output_mutation=True)
+def get_correlation_store() -> CorrelationStore:
+    """Returns the pairwise statistics of each dataset, dropped when its file changes"""
+    correlations = CorrelationStore()
+    get_dataset_catalogue().subscribe(correlations.invalidate)
+    return correlations
+
+
 def get_datasets_and_file_names() -> Dict:
     """Returns a dictionary of categories and files
 
@@ -79,20 +159,7 @@ def get_datasets_and_file_names() -> Dict:
         Key is the name of the category, value is a dictionary with information on files in that \
         category
     """
-    path = pathlib.Path("Data")
-
-    data_files = {}
-    for i in path.glob("*.csv"):
-        # st.write(i)
-        file = str(i.parts[-1])
-        data_files.update({str(file).replace(".csv", ""): file})
-    if len(data_files) == 0:
-        path = pathlib.Path.cwd().joinpath("CSATS_PSU_2021").joinpath("Data")
-        for i in path.glob("*.csv"):
-            # st.write(i)
-            file = str(i.parts[-1])
-            data_files.update({str(file).replace(".csv", ""): file})
-    return data_files
+    return get_dataset_catalogue().files()
 
 
 def get_data_info(category: str, file_name: str) -> Dict:
@@ -222,16 +289,221 @@ def download_link(object_to_download, download_filename, download_link_text):
     return f'<a href="data:file/txt;base64,{b64}" download="{download_filename}">{download_link_text}</a>'
 
 
+@st.cache(allow_output_mutation=True)
+def get_render_pool() -> RenderPool:
+    """Returns the worker pool shared by every session on this server"""
+    return RenderPool(disk_cache=get_disk_cache())
+
+
+@st.cache(allow_output_mutation=True)
+def get_figure_jobs() -> FigureJobs:
+    """Returns the debounced figure builds shared by every session on this server"""
+    return FigureJobs(get_render_pool())
+
+
+def get_session_id() -> str:
+    """Returns the id of the Streamlit session running this script"""
+    return get_report_ctx().session_id
+
+
+def rerun_requested() -> bool:
+    """Returns True once this session has a newer rerun queued
+
+    Streamlit only stops a script for a rerun at its next st call, so a chart being
+    built would otherwise finish and be thrown away. There is no public API for
+    this, it reads the session's script request queue and answers False if those
+    internals aren't there.
+    """
+    try:
+        session = Server.get_current()._get_session_info(get_session_id()).session
+        return session._script_request_queue.has_request
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _int_message_size(handler) -> int:
+    return int(handler.settings.get("websocket_max_message_size", 10 * 1024 * 1024))
+
+
+def allow_compressed_messages():
+    """Makes websocket compression work on Streamlit releases that break it
+
+    .streamlit/config.toml turns on server.enableWebsocketCompression, but these
+    releases give tornado a float message size limit (50 * 1e6) and tornado hands
+    it to zlib, so the first compressed message from a browser fails and the
+    connection closes. New connections read the limit from the handler class, the
+    ones already open keep it in their decompressor, so both are given an int.
+    """
+    current = getattr(_BrowserWebSocketHandler, "max_message_size", None)
+    if not isinstance(current, property) or current.fget is _int_message_size:
+        return
+    _BrowserWebSocketHandler.max_message_size = property(_int_message_size)
+    try:
+        session_infos = list(Server.get_current()._session_info_by_id.values())
+    except (AttributeError, RuntimeError):
+        return
+    for session_info in session_infos:
+        connection = getattr(session_info.ws, "ws_connection", None)
+        decompressor = getattr(connection, "_decompressor", None)
+        if decompressor is not None:
+            decompressor._max_message_size = int(decompressor._max_message_size)
+
+
+allow_compressed_messages()
+
+
+def publish_dataset(df: pd.DataFrame) -> str:
+    """Writes the dataset to the render pool store if needed and returns its id
+
+    Called on every rerun so the store knows the dataset is still in use.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The current dataset
+
+    Returns
+    -------
+    str
+        The id the render workers use to open the dataset
+    """
+    return get_render_pool().publish(df)
+
+
+def show_figure(container, fig: Union[go.Figure, Dict], show_size: bool = False):
+    """Sends a figure to the page in a form the bundled plotly.js can draw
+
+    Parameters
+    ----------
+    container
+        Where to draw the chart, st itself or a placeholder from st.empty()
+    fig : Union[go.Figure, Dict]
+        The figure, or a figure dict
+    show_size : bool
+        Write the size of the JSON Streamlit sends under the chart
+    """
+    payload = browser_figure(fig)
+    container.plotly_chart(payload, use_container_width=False)
+    if show_size:
+        size = f"Chart payload: {payload_bytes(payload):,} bytes"
+        if st.get_option("server.enableWebsocketCompression"):
+            size += f", about {compressed_bytes(payload):,} bytes compressed"
+        st.text(size)
+
+
+def get_mesh_files() -> Dict:
+    """Returns the mesh files in the Meshes folder, keyed by file name"""
+    for path in [
+        pathlib.Path("Meshes"),
+        pathlib.Path.cwd().joinpath("CSATS_PSU_2021").joinpath("Meshes"),
+    ]:
+        mesh_files = {
+            i.name: i
+            for i in sorted(path.glob("*"))
+            if i.suffix.lower() in mesh_formats
+        }
+        if mesh_files:
+            return mesh_files
+    return {}
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False)
+def get_mesh_payload(path: pathlib.Path, modified: int) -> Dict:
+    """Returns the figure of a mesh file, built once per version of the file
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The .ply or .glb file
+    modified : int
+        Modification time of the file, so an updated file is read again
+
+    Returns
+    -------
+    Dict
+        The figure in the default colour, shared between sessions so it
+        shouldn't be changed, see style_mesh
+    """
+    return mesh_payload(path, disk_cache=get_disk_cache())
+
+
+@st.cache(show_spinner=False)
+def get_allometry_fits(
+    df: pd.DataFrame, x_col: str, y_col: str, group_col: str, n_boot: int
+) -> pd.DataFrame:
+    """Returns OLS and RMA fits of every group, cached per dataset and settings
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The current dataset
+    x_col : str
+        Predictor column
+    y_col : str
+        Response column
+    group_col : str
+        Column to split by, or None to fit all rows together
+    n_boot : int
+        Bootstrap resamples per group
+
+    Returns
+    -------
+    pd.DataFrame
+        One row of coefficients per group
+    """
+    # Starting work in the pool only pays off for larger bootstraps
+    if len(df) * n_boot > 5_000_000:
+        map_function = get_render_pool().map
+    else:
+        map_function = map
+    disk_cache = get_disk_cache()
+    return disk_cache.get_or_compute(
+        disk_cache.key("allometry", dataset_id(df), x_col, y_col, group_col, n_boot),
+        lambda: fit_groups(
+            df, x_col, y_col, group_col, n_boot=n_boot, map_function=map_function
+        ),
+    )
+
+
+@st.cache(show_spinner=False)
+def sort_line_data(df: pd.DataFrame, x_col: str) -> pd.DataFrame:
+    """Returns the dataset sorted along the x-axis of a line plot
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The current dataset
+    x_col : str
+        The column used for the x-axis
+
+    Returns
+    -------
+    pd.DataFrame
+        Stable sorted copy of the dataset with a fresh index
+    """
+    return df.sort_values(str(x_col), kind="mergesort").reset_index(drop=True)
+
+
 def main():
     get_CASTS_data_repo()
     data_dict = get_datasets_and_file_names()
-    st.sidebar.image(workshop_logo, width=275, output_format="PNG")
-    st.sidebar.image(
-        [morpho_logo, psu_logo],
-        width=120,
-        caption=["Duke University", "FEMR Lab"],
-        output_format="PNG",
-    )
+    assets = get_asset_cache()
+    workshop_asset = assets.get(workshop_logo, width=275, local_path=workshop_logo_file)
+    if workshop_asset:
+        st.sidebar.image(workshop_asset.data, width=275, output_format="PNG")
+    partner_assets = [
+        (assets.get(url, width=120), caption)
+        for url, caption in [(morpho_logo, "Duke University"), (psu_logo, "FEMR Lab")]
+    ]
+    partner_assets = [(asset, caption) for asset, caption in partner_assets if asset]
+    if partner_assets:
+        st.sidebar.image(
+            [asset.data for asset, _ in partner_assets],
+            width=120,
+            caption=[caption for _, caption in partner_assets],
+            output_format="PNG",
+        )
+    show_payload = st.sidebar.checkbox("Show chart payload sizes")
 
     csv_list = [k for k, v in data_dict.items()]
     """
@@ -247,18 +519,58 @@ def main():
 
     option = st.selectbox("Select dataset", csv_list, key=9990237)
     st.write("Viewing", option)
+    dataset_name = option
     # Have to put ?raw=True at end to get the data
 
     with st.beta_expander("View/hide current dataset", expanded=True):
         if option:
+            current_df = get_dataset_catalogue().read(option)
+            dataset_version = get_dataset_catalogue().version(option)
+            derived_definitions = st.session_state.setdefault(
+                "derived_columns", {}
+            ).setdefault(option, [])
+            if st.checkbox("Add derived columns"):
+                derived_col1, derived_col2, derived_col3 = st.beta_columns((1, 2, 1))
+                with derived_col1:
+                    derived_name = st.text_input("New column name")
+                with derived_col2:
+                    derived_expression = st.text_input(
+                        "Expression, like FemurLength / HumerusLength or log10(`Body mass`)"
+                    )
+                with derived_col3:
+                    if st.button("Add column") and derived_name and derived_expression:
+                        if derived_name in current_df.columns or derived_name in [
+                            name for name, _ in derived_definitions
+                        ]:
+                            st.error(f"There is already a column called {derived_name}")
+                        else:
+                            new_definitions = derived_definitions + [
+                                (derived_name, derived_expression)
+                            ]
+                            try:
+                                get_derived_columns().add_columns(
+                                    current_df,
+                                    option,
+                                    dataset_version,
+                                    new_definitions,
+                                )
+                                derived_definitions.append(
+                                    (derived_name, derived_expression)
+                                )
+                            except ValueError as error:
+                                st.error(f"{error}")
+                    if derived_definitions and st.button("Remove derived columns"):
+                        derived_definitions.clear()
+                for name, expression in derived_definitions:
+                    st.write(f"{name} = {expression}")
             try:
-                current_df = pd.read_csv(f"Data/{data_dict[option]}")
-            except:
-                current_df = pd.read_csv(
-                    pathlib.Path.cwd()
-                    .joinpath("CSATS_PSU_2021")
-                    .joinpath(f"Data/{data_dict[option]}")
+                current_df = get_derived_columns().add_columns(
+                    current_df, option, dataset_version, derived_definitions
                 )
+            except ValueError as error:
+                # A definition that no longer fits the dataset, like after its file
+                # lost a column
+                st.error(f"The derived columns couldn't be added: {error}")
         else:
             st.write("Please select a dataset from the drop down")
         if len(current_df) != 0:
@@ -276,6 +588,16 @@ def main():
                     download_link_text=f"Click here to download {str(option)} data!",
                 )
                 st.markdown(tmp_download_link, unsafe_allow_html=True)
+            paper = get_paper_index().paper_for_dataset(str(option))
+            if paper and st.checkbox(f"View source paper ({paper})"):
+                paper_page = st.number_input(
+                    "Page",
+                    min_value=1,
+                    max_value=get_paper_index().page_count(paper),
+                    value=1,
+                    step=1,
+                )
+                st.image(get_paper_index().page_image(paper, int(paper_page) - 1))
         else:
             current_df = pd.DataFrame()
 
@@ -299,6 +621,233 @@ def main():
                 "https://aleph-viewer.com/", height=int(aleph_view_height)
             )
 
+        elif str(option) == "Correlation explorer":
+            df = current_df
+            val_list = [str(x) for x in df.select_dtypes("number").columns]
+            name_list = ["None"] + [x for x in df.columns[df.dtypes == "object"]]
+            with st.beta_expander(f"View/Hide {option.lower()}", expanded=True):
+                col1, col2, col3, col4, col5 = st.beta_columns((2, 1, 1, 1, 1))
+                with col1:
+                    corr_columns = st.multiselect(
+                        "Variables", val_list, default=val_list[:6]
+                    )
+                with col2:
+                    splom_color = st.selectbox("Color points by", name_list)
+                    if splom_color == "None":
+                        splom_color = None
+                with col3:
+                    chart_height = st.slider(
+                        "Chart height", min_value=1, max_value=1440, value=700, step=1
+                    )
+                    chart_width = st.slider(
+                        "Chart width", min_value=1, max_value=2880, value=700, step=1
+                    )
+                with col4:
+                    splom_points = st.slider(
+                        "Points in scatter matrix",
+                        min_value=100,
+                        max_value=10000,
+                        value=2000,
+                        step=100,
+                    )
+                with col5:
+                    if st.checkbox("View legend"):
+                        view_legend = True
+                    else:
+                        view_legend = False
+
+                if len(corr_columns) > 0:
+                    corr_matrix = get_correlation_store().correlations(
+                        dataset_name,
+                        get_dataset_catalogue().version(dataset_name),
+                        df,
+                        corr_columns,
+                    )
+                    fig = px.imshow(
+                        corr_matrix,
+                        zmin=-1,
+                        zmax=1,
+                        color_continuous_scale="RdBu_r",
+                        text_auto=".2f",
+                        title="Pearson correlations",
+                        template=template,
+                    )
+                    fig.update_layout(height=chart_height, width=chart_width)
+                    show_figure(st, fig, show_size=show_payload)
+                if len(corr_columns) > 1:
+                    splom_df = downsample(df, splom_points, by=splom_color)
+                    fig = px.scatter_matrix(
+                        splom_df,
+                        dimensions=corr_columns,
+                        color=splom_color,
+                        title=f"Scatter matrix of {len(splom_df)} of {len(df)} rows",
+                        template=template,
+                    )
+                    fig.update_traces(diagonal_visible=False, marker={"size": 4})
+                    fig.update_layout(
+                        showlegend=view_legend,
+                        height=chart_height,
+                        width=chart_width,
+                    )
+                    show_figure(st, fig, show_size=show_payload)
+
+        elif str(option) == "Allometry":
+            df = current_df
+            val_list = [x for x in df.columns[df.dtypes != "object"]]
+            name_list = ["None"] + [x for x in df.columns[df.dtypes != "float64"]]
+            with st.beta_expander(f"View/Hide {option.lower()}", expanded=True):
+                col1, col2, col3, col4, col5 = st.beta_columns((1, 1, 1, 1, 1))
+                with col1:
+                    # Log body mass against log brain size when the dataset has them,
+                    # otherwise two different columns so the first fit can run
+                    x_default = (
+                        val_list.index("logBodyMass")
+                        if "logBodyMass" in val_list
+                        else 0
+                    )
+                    y_default = (
+                        val_list.index("logECV")
+                        if "logECV" in val_list
+                        else min(1, len(val_list) - 1)
+                    )
+                    allometry_x = st.selectbox(
+                        "X-axis values", val_list, index=x_default
+                    )
+                    allometry_y = st.selectbox(
+                        "Y-axis values", val_list, index=y_default
+                    )
+                with col2:
+                    allometry_group = st.selectbox("Fit separately by", name_list)
+                    if allometry_group == "None":
+                        allometry_group = None
+                    fit_list = [k for k, v in fit_types.items()]
+                    allometry_fit = fit_types[st.selectbox("Fit type", fit_list)]
+                with col3:
+                    chart_height = st.slider(
+                        "Chart height", min_value=1, max_value=1440, value=500, step=1
+                    )
+                    chart_width = st.slider(
+                        "Chart width", min_value=1, max_value=2880, value=700, step=1
+                    )
+                with col4:
+                    n_boot = st.slider(
+                        "Bootstrap resamples",
+                        min_value=0,
+                        max_value=10000,
+                        value=1000,
+                        step=500,
+                    )
+                with col5:
+                    if st.checkbox("View legend", value=True):
+                        view_legend = True
+                    else:
+                        view_legend = False
+
+                try:
+                    fits = get_allometry_fits(
+                        df, allometry_x, allometry_y, allometry_group, n_boot
+                    )
+                except ValueError as error:
+                    st.warning(f"Can't fit {allometry_y} on {allometry_x}: {error}")
+                else:
+                    # Never the name of a group, see fit_groups
+                    pooled = fits.index[-1]
+                    if allometry_group:
+                        allometry_title = f"{allometry_y} by {allometry_x} fitted separately for each {allometry_group}"
+                        point_color = df[str(allometry_group)].astype(str)
+                    else:
+                        allometry_title = f"{allometry_y} by {allometry_x}"
+                        point_color = None
+                    fig = px.scatter(
+                        df,
+                        x=str(allometry_x),
+                        y=str(allometry_y),
+                        color=point_color,
+                        title=allometry_title,
+                        template=template,
+                    )
+                    for trace in list(fig.data):
+                        group_name = trace.name if allometry_group else pooled
+                        if group_name not in fits.index:
+                            continue
+                        line_x = np.array([np.nanmin(trace.x), np.nanmax(trace.x)])
+                        fig.add_trace(
+                            go.Scatter(
+                                x=line_x,
+                                y=fits.loc[group_name, f"{allometry_fit}_intercept"]
+                                + fits.loc[group_name, f"{allometry_fit}_slope"]
+                                * line_x,
+                                mode="lines",
+                                line={"color": trace.marker.color},
+                                name=f"{group_name} fit",
+                                legendgroup=trace.legendgroup,
+                            )
+                        )
+                    if allometry_group:
+                        line_x = np.array(
+                            [df[str(allometry_x)].min(), df[str(allometry_x)].max()]
+                        )
+                        fig.add_trace(
+                            go.Scatter(
+                                x=line_x,
+                                y=fits.loc[pooled, f"{allometry_fit}_intercept"]
+                                + fits.loc[pooled, f"{allometry_fit}_slope"] * line_x,
+                                mode="lines",
+                                line={"color": "black", "dash": "dash"},
+                                name=f"{pooled} fit",
+                            )
+                        )
+                    fig.update_layout(
+                        showlegend=view_legend,
+                        legend_title_text=f"{allometry_group or ''}",
+                        height=chart_height,
+                        width=chart_width,
+                    )
+                    show_figure(st, fig, show_size=show_payload)
+                    st.table(fits.round(3))
+
+        elif str(option) == "Mesh viewer":
+            mesh_files = get_mesh_files()
+            with st.beta_expander(f"View/Hide {option.lower()}", expanded=True):
+                col1, col2, col3, col4, col5 = st.beta_columns((1, 1, 1, 1, 1))
+                with col1:
+                    mesh_name = st.selectbox("Mesh", list(mesh_files))
+                with col2:
+                    mesh_color = st.color_picker("Mesh color", default_mesh_color)
+                    mesh_opacity = st.slider(
+                        "Opacity", min_value=0.0, max_value=1.0, value=1.0, step=0.05
+                    )
+                with col3:
+                    chart_height = st.slider(
+                        "Chart height", min_value=1, max_value=1440, value=700, step=1
+                    )
+                    chart_width = st.slider(
+                        "Chart width", min_value=1, max_value=2880, value=700, step=1
+                    )
+                if mesh_name:
+                    mesh_path = mesh_files[mesh_name]
+                    try:
+                        payload = get_mesh_payload(
+                            mesh_path, mesh_path.stat().st_mtime_ns
+                        )
+                    except ValueError as error:
+                        st.error(f"{mesh_name} can't be read: {error}")
+                    else:
+                        layout = dict(
+                            payload["layout"],
+                            title={"text": mesh_name},
+                            template=template,
+                            height=chart_height,
+                            width=chart_width,
+                        )
+                        fig = dict(
+                            style_mesh(payload, mesh_color, mesh_opacity),
+                            layout=layout,
+                        )
+                        show_figure(st, fig, show_size=show_payload)
+                else:
+                    st.write("There are no .ply or .glb files in the Meshes folder")
+
         elif str(option) == "Box plots":
             df = current_df
             x_list = [x for x in df.columns[df.dtypes != "float64"]]
@@ -338,7 +887,7 @@ def main():
                 fig.update_layout(
                     showlegend=view_legend, height=chart_height, width=chart_width
                 )
-                st.plotly_chart(fig, use_container_width=False)
+                show_figure(st, fig, show_size=show_payload)
 
         elif str(option) == "Scatter plots":
             df = current_df
@@ -386,25 +935,33 @@ def main():
                     else:
                         scatter_trendline = None
 
+                chart_slot = st.empty()
                 try:
-                    fig = px.scatter(
-                        df,
-                        x=str(x_axis),
-                        y=str(y_axis),
-                        color=df[str(color_by)].astype(str),
-                        color_discrete_sequence=color_num,
-                        title=figure_title,
-                        size=point_size,
-                        trendline=scatter_trendline,
-                        template=template,
+                    fig = get_figure_jobs().render(
+                        get_session_id(),
+                        publish_dataset(df),
+                        "scatter",
+                        dict(
+                            x=str(x_axis),
+                            y=str(y_axis),
+                            color=str(color_by),
+                            color_discrete_sequence=color_num,
+                            title=figure_title,
+                            size=point_size,
+                            trendline=scatter_trendline,
+                            template=template,
+                        ),
+                        layout_args=dict(
+                            showlegend=view_legend,
+                            legend_title_text=f"{color_by}",
+                            height=chart_height,
+                            width=chart_width,
+                        ),
+                        as_str=["color"],
+                        rerun_requested=rerun_requested,
                     )
-                    fig.update_layout(
-                        showlegend=view_legend,
-                        legend_title_text=f"{color_by}",
-                        height=chart_height,
-                        width=chart_width,
-                    )
-                    st.plotly_chart(fig, use_container_width=False)
+                    if fig is not None:
+                        show_figure(chart_slot, fig, show_size=show_payload)
                 except ValueError:
                     nans = df[str(point_size)].isnull().values.any()
                     if nans:
@@ -458,25 +1015,33 @@ def main():
                     color_num = px.colors.qualitative.Alphabet
                 else:
                     color_num = None
+                chart_slot = st.empty()
                 try:
-                    fig = px.scatter_3d(
-                        df,
-                        x=str(x_axis),
-                        y=str(y_axis),
-                        z=str(z_axis),
-                        color=df[str(color_by)].astype(str),
-                        color_discrete_sequence=color_num,
-                        size=point_size,
-                        title=figure_title,
-                        template=template,
-                    )
-                    fig.update_layout(
-                        showlegend=view_legend,
-                        legend_title_text=f"{color_by}",
-                        height=chart_height,
-                        width=chart_width,
+                    fig = get_figure_jobs().render(
+                        get_session_id(),
+                        publish_dataset(df),
+                        "scatter_3d",
+                        dict(
+                            x=str(x_axis),
+                            y=str(y_axis),
+                            z=str(z_axis),
+                            color=str(color_by),
+                            color_discrete_sequence=color_num,
+                            size=point_size,
+                            title=figure_title,
+                            template=template,
+                        ),
+                        layout_args=dict(
+                            showlegend=view_legend,
+                            legend_title_text=f"{color_by}",
+                            height=chart_height,
+                            width=chart_width,
+                        ),
+                        as_str=["color"],
+                        rerun_requested=rerun_requested,
                     )
-                    st.plotly_chart(fig, use_container_width=False)
+                    if fig is not None:
+                        show_figure(chart_slot, fig, show_size=show_payload)
                 except ValueError:
                     nans = df[str(point_size)].isnull().values.any()
                     if nans:
@@ -538,7 +1103,7 @@ def main():
                         height=chart_height,
                         width=chart_width,
                     )
-                    st.plotly_chart(fig, use_container_width=False)
+                    show_figure(st, fig, show_size=show_payload)
                 except ValueError:
                     st.write("Select your x axis and y axis from the dropdowns")
 
@@ -614,7 +1179,7 @@ def main():
                         height=chart_height,
                         width=chart_width,
                     )
-                    st.plotly_chart(fig, use_container_width=False)
+                    show_figure(st, fig, show_size=show_payload)
                 except ValueError:
                     st.write("Select your x axis and y axis from the dropdowns")
 
@@ -702,6 +1267,7 @@ def main():
                         view_box = True
                     else:
                         view_box = False
+                chart_slot = st.empty()
                 if grouped_violin:
                     group1 = go.Violin(
                         x=df[f"{violin_x_vals}"],
@@ -778,23 +1344,32 @@ def main():
                     )
 
                 else:
-                    fig = px.violin(
-                        df,
-                        x=f"{violin_x_vals}",
-                        y=f"{violin_y_vals}",
-                        color=f"{cat_names}",
-                        title=violin_title,
-                        box=view_box,
-                        points=view_points,
-                        template=template,
-                        color_discrete_sequence=cat_color,
-                        height=chart_height,
-                        width=chart_width,
-                    ).update_traces(side=None, width=cat_spacing, meanline_visible=True)
-                    fig.update_layout(
-                        showlegend=view_legend, legend_title_text=legend_title
+                    fig = get_figure_jobs().render(
+                        get_session_id(),
+                        publish_dataset(df),
+                        "violin",
+                        dict(
+                            x=f"{violin_x_vals}",
+                            y=f"{violin_y_vals}",
+                            color=f"{cat_names}",
+                            title=violin_title,
+                            box=view_box,
+                            points=view_points,
+                            template=template,
+                            color_discrete_sequence=cat_color,
+                            height=chart_height,
+                            width=chart_width,
+                        ),
+                        trace_args=dict(
+                            side=None, width=cat_spacing, meanline_visible=True
+                        ),
+                        layout_args=dict(
+                            showlegend=view_legend, legend_title_text=legend_title
+                        ),
+                        rerun_requested=rerun_requested,
                     )
-                st.plotly_chart(fig, use_container_width=False)
+                if fig is not None:
+                    show_figure(chart_slot, fig, show_size=show_payload)
 
         elif str(option) == "Line plot":
             df = current_df
@@ -816,6 +1391,10 @@ def main():
                     chart_width = st.slider(
                         "Chart width", min_value=1, max_value=2880, value=720, step=1
                     )
+                with col4:
+                    decimation_list = [k for k, v in decimation_methods.items()]
+                    line_decimation = st.selectbox("Resampling", decimation_list)
+                    line_decimation = decimation_methods[line_decimation]
 
                 with col5:
                     if st.checkbox("View legend"):
@@ -838,8 +1417,17 @@ def main():
                         legend_title = None
                         line_title = f"Line plot of {line_x_vals} by {line_y_vals}"
 
+                line_df = sort_line_data(df, line_x_vals)
+                line_df = decimate_line_data(
+                    line_df,
+                    x=str(line_x_vals),
+                    y=str(line_y_vals),
+                    n_points=int(chart_width),
+                    method=line_decimation,
+                    color=line_names,
+                )
                 fig = px.line(
-                    df,
+                    line_df,
                     x=line_x_vals,
                     y=line_y_vals,
                     title=line_title,
@@ -853,7 +1441,7 @@ def main():
                     height=chart_height,
                     width=chart_width,
                 )
-                st.plotly_chart(fig, use_container_width=False)
+                show_figure(st, fig, show_size=show_payload)
 
         elif str(option) == "Joyplot":
             df = current_df
@@ -897,22 +1485,30 @@ def main():
                 joy_title = f"Joyplot of {joy_vals} by {joy_name}"
                 legend_title = f"{joy_name}"
                 # st.help(px.violin)
-                fig = px.violin(
-                    df,
-                    y=joy_name,
-                    x=val_list,
-                    range_x=range_x,
-                    color=joy_name,
-                    orientation="h",
-                    title=joy_title,
-                    template=template,
-                    height=chart_height,
-                    width=chart_width,
-                ).update_traces(side="positive", width=cat_spacing)
-                fig.update_layout(
-                    showlegend=view_legend, legend_title_text=legend_title
+                chart_slot = st.empty()
+                fig = get_figure_jobs().render(
+                    get_session_id(),
+                    publish_dataset(df),
+                    "violin",
+                    dict(
+                        y=joy_name,
+                        x=val_list,
+                        range_x=range_x,
+                        color=joy_name,
+                        orientation="h",
+                        title=joy_title,
+                        template=template,
+                        height=chart_height,
+                        width=chart_width,
+                    ),
+                    trace_args=dict(side="positive", width=cat_spacing),
+                    layout_args=dict(
+                        showlegend=view_legend, legend_title_text=legend_title
+                    ),
+                    rerun_requested=rerun_requested,
                 )
-                st.plotly_chart(fig, use_container_width=False)
+                if fig is not None:
+                    show_figure(chart_slot, fig, show_size=show_payload)
 
         # This doesn't work on the streamlit hosted version, likely due to the unsafe html setting
         # col1_lower, col2_lower = st.beta_columns(2)
@@ -932,6 +1528,26 @@ def main():
         # with col2_lower:
         #    title = st.empty()
 
+    with st.sidebar.beta_expander("Figure build statistics"):
+        build_stats = pd.DataFrame(
+            {
+                "This session": get_figure_jobs().stats(get_session_id()).as_dict(),
+                "All sessions": get_figure_jobs().stats().as_dict(),
+            }
+        )
+        st.table(build_stats)
+        st.write("Disk cache")
+        st.table(get_disk_cache().stats())
+
+    with st.sidebar.beta_expander("Search the papers"):
+        paper_query = st.text_input("Search words")
+        if paper_query:
+            paper_hits = get_paper_index().search(paper_query)
+            if not paper_hits:
+                st.write("No pages contain all of those words")
+            for hit in paper_hits:
+                st.markdown(f"**{hit.paper}**, page {hit.page + 1}\n\n{hit.snippet}")
+
     with st.sidebar.beta_expander("About"):
         "This app helps students visualizes scientific data to explore our evolutionary history"
         "\n\n"
@@ -0,0 +1,62 @@
+"""Tests for the grouped allometry fits."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from allometry import fit_groups
+
+
+def test_pooled_fit_does_not_replace_a_group_called_all():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=40)
+    df = pd.DataFrame(
+        {
+            "x": x,
+            "y": np.where(np.arange(40) < 20, 2 * x, -x) + rng.normal(0, 0.01, 40),
+            "group": ["All"] * 20 + ["Other"] * 20,
+        }
+    )
+
+    fits = fit_groups(df, "x", "y", "group")
+
+    assert list(fits.index) == ["All", "Other", "All (pooled)"]
+    assert fits.loc["All", "n"] == 20
+    assert fits.loc["All (pooled)", "n"] == 40
+    np.testing.assert_allclose(fits.loc["All", "ols_slope"], 2, atol=0.01)
+
+
+def test_slopes_and_intercepts_match_closed_forms():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=60)
+    y = np.where(np.arange(60) < 30, 0.75 * x + 1, -1.5 * x) + rng.normal(0, 0.3, 60)
+    df = pd.DataFrame({"x": x, "y": y, "group": ["a"] * 30 + ["b"] * 30})
+
+    fits = fit_groups(df, "x", "y", "group")
+
+    for label, rows in [
+        ("a", slice(0, 30)),
+        ("b", slice(30, 60)),
+        ("All", slice(0, 60)),
+    ]:
+        gx, gy = x[rows], y[rows]
+        ols_slope, ols_intercept = np.polyfit(gx, gy, 1)
+        r = np.corrcoef(gx, gy)[0, 1]
+        rma_slope = np.sign(r) * gy.std() / gx.std()
+        row = fits.loc[label]
+        np.testing.assert_allclose(row["ols_slope"], ols_slope)
+        np.testing.assert_allclose(row["ols_intercept"], ols_intercept)
+        np.testing.assert_allclose(row["rma_slope"], rma_slope)
+        np.testing.assert_allclose(
+            row["rma_intercept"], gy.mean() - rma_slope * gx.mean()
+        )
+        np.testing.assert_allclose(row["r_squared"], r**2)
+
+
+@pytest.mark.parametrize(
+    "x, y, group", [("x", "x", None), ("x", "y", "x"), ("x", "y", "y")]
+)
+def test_fitting_a_column_against_itself_is_rejected(x, y, group):
+    df = pd.DataFrame({"x": [1.0, 2.0, 3.0], "y": [2.0, 4.0, 7.0]})
+
+    with pytest.raises(ValueError):
+        fit_groups(df, x, y, group)
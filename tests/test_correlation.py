@@ -0,0 +1,76 @@
+"""Tests for the column by column correlation updates."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from correlation import CorrelationMatrix
+
+
+def with_gaps(values, rng, share=0.2):
+    values = values.copy()
+    values[rng.random(len(values)) < share] = np.nan
+    return values
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=200)
+    columns = {
+        f"c{i}": with_gaps(base * i + rng.normal(size=200), rng) for i in range(6)
+    }
+    columns["count"] = rng.integers(0, 50, size=200)
+    columns["label"] = rng.choice(["a", "b"], size=200)
+    return pd.DataFrame(columns)
+
+
+def assert_matches_pandas(matrix, df):
+    expected = df.select_dtypes("number").corr()
+    result = matrix.matrix()
+    assert sorted(result.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(
+        result.loc[expected.index, expected.columns], expected, atol=1e-10
+    )
+
+
+def test_updates_match_pandas(df):
+    rng = np.random.default_rng(1)
+    matrix = CorrelationMatrix()
+    assert sorted(matrix.update(df)) == sorted(df.columns.drop("label"))
+    assert_matches_pandas(matrix, df)
+
+    # Added column, only it is recomputed
+    df["added"] = with_gaps(df["c2"].to_numpy() ** 2, rng, share=0.5)
+    assert matrix.update(df) == ["added"]
+    assert_matches_pandas(matrix, df)
+
+    # Changed values and gaps in a column in the middle
+    df["c3"] = with_gaps(rng.normal(size=len(df)), rng, share=0.4)
+    assert matrix.update(df) == ["c3"]
+    assert_matches_pandas(matrix, df)
+
+    # Dropped column, nothing is recomputed
+    df = df.drop(columns="c1")
+    assert matrix.update(df) == []
+    assert_matches_pandas(matrix, df)
+
+    # Dropped and added together, and a column that barely overlaps the others
+    sparse = np.full(len(df), np.nan)
+    sparse[:3] = [1.0, 2.0, 4.0]
+    df = df.drop(columns="c4").assign(sparse=sparse)
+    assert matrix.update(df) == ["sparse"]
+    assert_matches_pandas(matrix, df)
+
+    # Most columns changed, rebuilt in one go
+    for name in ["c0", "c2", "c5", "count", "added"]:
+        df[name] = with_gaps(rng.normal(size=len(df)), rng)
+    assert len(matrix.update(df)) == 5
+    assert_matches_pandas(matrix, df)
+
+
+def test_new_index_starts_over(df):
+    matrix = CorrelationMatrix()
+    matrix.update(df)
+    subset = df.iloc[::2]
+    assert sorted(matrix.update(subset)) == sorted(df.columns.drop("label"))
+    assert_matches_pandas(matrix, subset)
@@ -0,0 +1,105 @@
+"""Tests for checking and evaluating derived column expressions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from derived_columns import DerivedColumnCache, evaluate, referenced_columns
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "FemurLength": [400.0, 450.0, 380.0],
+            "HumerusLength": [300.0, 310.0, 290.0],
+            "Body mass": [60.0, 70.0, 1000.0],
+            "count": [1, 2, 3],
+            "Species": ["a", "b", "c"],
+        }
+    )
+
+
+def test_arithmetic_and_functions_match_numpy(df):
+    result = evaluate(df, "log10(`Body mass`) + FemurLength / HumerusLength")
+    expected = np.log10(df["Body mass"]) + df["FemurLength"] / df["HumerusLength"]
+    np.testing.assert_allclose(result, expected)
+    assert result.dtype == np.float64
+
+    result = evaluate(df, "arctan2(FemurLength, count) - abs(-2)")
+    expected = np.arctan2(df["FemurLength"], df["count"]) - 2
+    np.testing.assert_allclose(result, expected)
+
+
+def test_constant_expression_fills_the_column(df):
+    np.testing.assert_array_equal(evaluate(df, "2 * 3"), [6.0, 6.0, 6.0])
+
+
+def test_backtick_names_are_columns(df):
+    assert referenced_columns("`Body mass` ** 2 / count", list(df.columns)) == {
+        "Body mass",
+        "count",
+    }
+    with pytest.raises(ValueError, match="no column called Body weight"):
+        referenced_columns("`Body weight` * 2", list(df.columns))
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "FemurLength.max()",
+        "__import__('os')",
+        "log10(x=FemurLength)",
+        "FemurLength > HumerusLength",
+        "FemurLength if count else HumerusLength",
+        "[FemurLength]",
+        "FemurLength @ HumerusLength",
+        "'text'",
+        "system(FemurLength)",
+        "FemurLength +",
+    ],
+)
+def test_anything_but_arithmetic_is_rejected(df, expression):
+    with pytest.raises(ValueError):
+        referenced_columns(expression, list(df.columns))
+
+
+@pytest.mark.parametrize(
+    "expression", ["log10()", "arctan2(FemurLength)", "sqrt(FemurLength, count)"]
+)
+def test_wrong_number_of_arguments_is_rejected(df, expression):
+    with pytest.raises(ValueError, match="argument"):
+        evaluate(df, expression)
+
+
+def test_function_name_used_as_a_column_is_rejected(df):
+    with pytest.raises(ValueError, match="no column called log10"):
+        evaluate(df, "log10(FemurLength) + log10")
+
+
+@pytest.mark.parametrize("expression", ["9 ** 9 ** 9", "2 ** 5000", "3 ** (999 * 999)"])
+def test_huge_constant_powers_are_rejected(df, expression):
+    with pytest.raises(ValueError, match="Exponents"):
+        evaluate(df, expression)
+
+
+def test_small_and_column_exponents_are_allowed(df):
+    np.testing.assert_allclose(
+        evaluate(df, "FemurLength ** (1 / 3) + 2 ** -2"),
+        df["FemurLength"] ** (1 / 3) + 0.25,
+    )
+    np.testing.assert_allclose(evaluate(df, "2 ** count"), 2.0 ** df["count"])
+
+
+def test_non_numeric_columns_are_rejected(df):
+    with pytest.raises(ValueError, match="Species isn't a numeric column"):
+        evaluate(df, "Species * 2")
+
+
+def test_later_columns_use_earlier_ones(df):
+    cache = DerivedColumnCache()
+    definitions = [("ratio", "FemurLength / HumerusLength"), ("double", "ratio * 2")]
+
+    result = cache.add_columns(df, "limbs", 1, definitions)
+
+    np.testing.assert_allclose(result["double"], 2 * result["ratio"])
+    assert "ratio" not in df.columns
@@ -0,0 +1,86 @@
+"""Tests for the LTTB and min-max line downsampling."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from line_decimation import decimate_line_data, lttb, min_max
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(0, 100, size=5000))
+    y = np.cumsum(rng.normal(size=5000))
+    # A single sample spike that either method should keep
+    y[2500] = 500.0
+    return x, y
+
+
+@pytest.mark.parametrize("n_out", [3, 10, 100, 1000])
+def test_lttb_keeps_endpoints_and_size(series, n_out):
+    x, y = series
+    positions = lttb(x, y, n_out)
+
+    assert len(positions) <= n_out
+    assert positions[0] == 0 and positions[-1] == len(x) - 1
+    assert np.all(np.diff(positions) > 0)
+    assert 2500 in positions
+
+
+def test_lttb_short_series_is_untouched(series):
+    x, y = series
+    np.testing.assert_array_equal(lttb(x[:50], y[:50], 100), np.arange(50))
+
+
+@pytest.mark.parametrize("n_buckets", [1, 7, 100, 1000])
+def test_min_max_keeps_every_bucket_extreme(series, n_buckets):
+    x, y = series
+    positions = min_max(x, y, n_buckets)
+
+    assert len(positions) <= 2 * n_buckets + 2
+    assert positions[0] == 0 and positions[-1] == len(x) - 1
+    assert np.all(np.diff(positions) > 0)
+    bucket_id = np.minimum(
+        ((x - x[0]) / (x[-1] - x[0]) * n_buckets).astype(np.int64), n_buckets - 1
+    )
+    kept = pd.Series(y[positions]).groupby(bucket_id[positions])
+    everything = pd.Series(y).groupby(bucket_id)
+    pd.testing.assert_series_equal(kept.min(), everything.min())
+    pd.testing.assert_series_equal(kept.max(), everything.max())
+
+
+def test_min_max_constant_x(series):
+    _, y = series
+    positions = min_max(np.zeros(len(y)), y, 10)
+    assert len(positions) <= 22
+    assert {0, len(y) - 1, int(np.argmin(y)), int(np.argmax(y))} <= set(positions)
+
+
+@pytest.mark.parametrize("method, n_points", [("lttb", 50), ("minmax", 20)])
+def test_each_colour_is_decimated_on_its_own(method, n_points):
+    rng = np.random.default_rng(1)
+    n = 3000
+    df = pd.DataFrame(
+        {
+            "t": np.arange(n, dtype=float),
+            "value": rng.normal(size=n),
+            # Interleaved lines of different lengths
+            "line": rng.choice(["a", "b", "c"], size=n, p=[0.6, 0.3, 0.1]),
+        }
+    )
+    decimate = {"lttb": lttb, "minmax": min_max}[method]
+
+    result = decimate_line_data(df, "t", "value", n_points, method, color="line")
+
+    assert result.index.is_monotonic_increasing
+    for name, line in df.groupby("line"):
+        positions = decimate(line["t"].to_numpy(), line["value"].to_numpy(), n_points)
+        pd.testing.assert_frame_equal(
+            result[result["line"] == name], line.iloc[positions]
+        )
+
+
+def test_unknown_method_raises_value_error():
+    df = pd.DataFrame({"t": [0.0, 1.0, 2.0], "value": [1.0, 2.0, 3.0]})
+    with pytest.raises(ValueError, match="Unknown decimation method"):
+        decimate_line_data(df, "t", "value", 2, "spline")
@@ -0,0 +1,184 @@
+"""Tests for the GLB and PLY readers on small files written by the tests."""
+
+import json
+import struct
+import numpy as np
+import pytest
+from mesh_loader import load_mesh
+
+square = np.array(
+    [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]],
+    dtype=np.float32,
+)
+
+
+def write_glb(path, gltf, binary):
+    """Writes a GLB file with one JSON and one BIN chunk"""
+    text = json.dumps(gltf).encode()
+    text += b" " * (-len(text) % 4)
+    binary += b"\0" * (-len(binary) % 4)
+    chunks = struct.pack("<II", len(text), 0x4E4F534A) + text
+    chunks += struct.pack("<II", len(binary), 0x004E4942) + binary
+    path.write_bytes(struct.pack("<4sII", b"glTF", 2, 12 + len(chunks)) + chunks)
+    return path
+
+
+def square_gltf(primitive, nodes=None, view=None, accessors=None):
+    return {
+        "asset": {"version": "2.0"},
+        "scenes": [{"nodes": [0]}],
+        "nodes": nodes or [{"mesh": 0}],
+        "meshes": [{"name": "square", "primitives": [primitive]}],
+        "bufferViews": [view or {"buffer": 0, "byteLength": square.nbytes}],
+        "accessors": accessors
+        or [{"bufferView": 0, "componentType": 5126, "count": 4, "type": "VEC3"}],
+    }
+
+
+def test_glb_interleaved_attributes(tmp_path):
+    normals = np.tile(np.array([0.0, 0.0, 1.0], dtype=np.float32), (4, 1))
+    interleaved = np.hstack([square, normals])
+    indices = np.array([0, 1, 2, 2, 1, 3], dtype=np.uint16)
+    gltf = square_gltf(
+        {"attributes": {"POSITION": 0, "NORMAL": 1}, "indices": 2},
+        view={"buffer": 0, "byteLength": interleaved.nbytes, "byteStride": 24},
+        accessors=[
+            {"bufferView": 0, "componentType": 5126, "count": 4, "type": "VEC3"},
+            {
+                "bufferView": 0,
+                "byteOffset": 12,
+                "componentType": 5126,
+                "count": 4,
+                "type": "VEC3",
+            },
+            {"bufferView": 1, "componentType": 5123, "count": 6, "type": "SCALAR"},
+        ],
+    )
+    gltf["bufferViews"].append(
+        {"buffer": 0, "byteOffset": interleaved.nbytes, "byteLength": 12}
+    )
+    path = write_glb(
+        tmp_path / "interleaved.glb", gltf, interleaved.tobytes() + indices.tobytes()
+    )
+
+    (mesh,) = load_mesh(path)
+    np.testing.assert_array_equal(mesh.vertices, square)
+    np.testing.assert_array_equal(mesh.normals, normals)
+    np.testing.assert_array_equal(mesh.faces, [[0, 1, 2], [2, 1, 3]])
+
+
+@pytest.mark.parametrize(
+    "mode, faces", [(5, [[0, 1, 2], [2, 1, 3]]), (6, [[0, 1, 2], [0, 2, 3]])]
+)
+def test_glb_strips_and_fans(tmp_path, mode, faces):
+    gltf = square_gltf({"attributes": {"POSITION": 0}, "mode": mode})
+    path = write_glb(tmp_path / "strip.glb", gltf, square.tobytes())
+
+    (mesh,) = load_mesh(path)
+    np.testing.assert_array_equal(mesh.faces, faces)
+
+
+def test_glb_node_transforms(tmp_path):
+    # The child is scaled by 2 and turned 90 degrees about z, its parent moved
+    # along x
+    half_turn = np.sqrt(0.5)
+    nodes = [
+        {"translation": [10.0, 0.0, 0.0], "children": [1]},
+        {"mesh": 0, "scale": [2.0, 2.0, 2.0], "rotation": [0, 0, half_turn, half_turn]},
+    ]
+    gltf = square_gltf({"attributes": {"POSITION": 0}}, nodes=nodes)
+    gltf["accessors"][0]["count"] = 3
+    path = write_glb(tmp_path / "moved.glb", gltf, square[:3].tobytes())
+
+    (mesh,) = load_mesh(path)
+    np.testing.assert_allclose(
+        mesh.vertices, [[10, 0, 0], [10, 2, 0], [8, 0, 0]], atol=1e-6
+    )
+
+
+@pytest.mark.parametrize(
+    "change",
+    [{"componentType": 5130}, {"type": "MAT3"}, {"count": 40}],
+    ids=["double", "mat3", "past the end"],
+)
+def test_glb_unreadable_accessors_raise_value_error(tmp_path, change):
+    gltf = square_gltf({"attributes": {"POSITION": 0}})
+    gltf["accessors"][0].update(change)
+    path = write_glb(tmp_path / "bad.glb", gltf, square.tobytes())
+
+    with pytest.raises(ValueError):
+        load_mesh(path)
+
+
+def write_ply(path, header_lines, body):
+    header = "\n".join(["ply", "format binary_little_endian 1.0"] + header_lines)
+    path.write_bytes((header + "\nend_header\n").encode() + body)
+    return path
+
+
+def test_ply_faces_with_extra_properties_and_long_header(tmp_path):
+    face_dtype = np.dtype(
+        [
+            ("n", "u1"),
+            ("vertex_indices", "<i4", (3,)),
+            ("rgb", "u1", (3,)),
+            ("q", "<f4"),
+        ]
+    )
+    faces = np.zeros(2, dtype=face_dtype)
+    faces["n"] = 3
+    faces["vertex_indices"] = [[0, 1, 2], [2, 1, 3]]
+    faces["rgb"] = 255
+    faces["q"] = 0.5
+    header = [f"comment padding line {i:04d} " + "x" * 40 for i in range(200)]
+    header += [
+        "element vertex 4",
+        "property float x",
+        "property float y",
+        "property float z",
+        "element face 2",
+        "property list uchar int vertex_indices",
+        "property uchar red",
+        "property uchar green",
+        "property uchar blue",
+        "property float quality",
+    ]
+    path = write_ply(
+        tmp_path / "colored.ply", header, square.tobytes() + faces.tobytes()
+    )
+
+    (mesh,) = load_mesh(path)
+    np.testing.assert_array_equal(mesh.vertices, square)
+    np.testing.assert_array_equal(mesh.faces, [[0, 1, 2], [2, 1, 3]])
+
+
+def test_ply_quads_raise_value_error(tmp_path):
+    quad = np.array([4], dtype="u1").tobytes() + np.arange(4, dtype="<i4").tobytes()
+    header = [
+        "element vertex 4",
+        "property float x",
+        "property float y",
+        "property float z",
+        "element face 1",
+        "property list uchar int vertex_indices",
+    ]
+    path = write_ply(tmp_path / "quad.ply", header, square.tobytes() + quad)
+
+    with pytest.raises(ValueError, match="triangle"):
+        load_mesh(path)
+
+
+@pytest.mark.parametrize(
+    "vertex_count, x_type", [(4, "uint64"), (40, "float")], ids=["type", "truncated"]
+)
+def test_ply_unreadable_vertices_raise_value_error(tmp_path, vertex_count, x_type):
+    header = [
+        f"element vertex {vertex_count}",
+        f"property {x_type} x",
+        "property float y",
+        "property float z",
+    ]
+    path = write_ply(tmp_path / "bad.ply", header, square.tobytes())
+
+    with pytest.raises(ValueError):
+        load_mesh(path)
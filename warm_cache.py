@@ -0,0 +1,94 @@
+"""Fills the on-disk cache before the app takes its first visitors.
+
+Parses every dataset in Data/, indexes the papers and builds the default figure
+of every mesh in Meshes/, so a freshly deployed instance on the same host and
+pointed at the same CSATS_CACHE_DIR serves them without doing the work again::
+
+    python warm_cache.py --data Data --meshes Meshes
+"""
+
+import time
+import pathlib
+import argparse
+from disk_cache import DiskCache, default_cache_dir, default_max_bytes
+from dataset_catalogue import DatasetCatalogue, default_data_dirs
+from mesh_loader import mesh_formats, mesh_payload
+from paper_index import PaperIndex
+from render_pool import RenderPool
+
+
+def warm_datasets(data_dir: pathlib.Path, disk_cache: DiskCache):
+    """Parses every CSV into the cache and publishes it to the render store"""
+    catalogue = DatasetCatalogue([data_dir], interval=0, disk_cache=disk_cache)
+    pool = RenderPool(disk_cache=disk_cache)
+    for name in catalogue.files():
+        start = time.perf_counter()
+        pool.publish(catalogue.read(name))
+        print(f"Dataset {name}: {time.perf_counter() - start:.2f} s")
+
+
+def warm_papers(data_dir: pathlib.Path, index_dir: pathlib.Path):
+    """Extracts and indexes the text of every PDF"""
+    papers = DatasetCatalogue([data_dir], pattern="*.pdf", interval=0)
+    index = PaperIndex(index_dir)
+    for name in papers.files():
+        start = time.perf_counter()
+        try:
+            index.add(name, papers.path(name))
+        except (OSError, RuntimeError) as error:
+            print(f"Paper {name} skipped: {error}")
+            continue
+        print(f"Paper {name}: {time.perf_counter() - start:.2f} s")
+
+
+def warm_meshes(mesh_dir: pathlib.Path, disk_cache: DiskCache):
+    """Builds the figure of every mesh, colour and opacity are applied when shown"""
+    for path in sorted(mesh_dir.glob("*")):
+        if path.suffix.lower() not in mesh_formats:
+            continue
+        start = time.perf_counter()
+        try:
+            mesh_payload(path, disk_cache=disk_cache)
+        except ValueError as error:
+            print(f"Mesh {path.name} skipped: {error}")
+            continue
+        print(f"Mesh {path.name}: {time.perf_counter() - start:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--data",
+        type=pathlib.Path,
+        default=default_data_dirs()[0],
+        help="CSV and PDF folder",
+    )
+    parser.add_argument(
+        "--meshes",
+        type=pathlib.Path,
+        default=pathlib.Path("Meshes"),
+        help="Mesh folder",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=pathlib.Path,
+        default=default_cache_dir,
+        help="Cache folder, defaults to CSATS_CACHE_DIR",
+    )
+    parser.add_argument(
+        "--max-mb",
+        type=int,
+        default=default_max_bytes // (1024 * 1024),
+        help="Size limit of the cache in MB",
+    )
+    args = parser.parse_args()
+
+    disk_cache = DiskCache(args.cache_dir, args.max_mb * 1024 * 1024)
+    warm_datasets(args.data, disk_cache)
+    warm_papers(args.data, args.cache_dir.joinpath("papers"))
+    warm_meshes(args.meshes, disk_cache)
+    print(disk_cache.stats().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()